@@ -0,0 +1,145 @@
+"""Benchmark cases, each one ``case(context)`` doing one measured run over the seeded data."""
+
+from functools import lru_cache
+
+from django.contrib import admin
+from django.db import models, transaction
+from django.test import RequestFactory
+
+from benchmarks.models import PRIORITY, Comment, Ticket
+from config import routing
+from core.admin import StatefulModelAdmin
+from core.serializers import EnumField, StatefulSerializer, get_all_field_serializer
+
+CASES = {}
+
+# rows rendered by the all field serializer cases
+LIST_SIZE = 10000
+
+# stored enum names decoded by the enum_values cases
+ENUM_VALUES = 100000
+
+
+def case(function):
+    CASES[function.__name__] = function
+    return function
+
+
+class TicketSerializer(StatefulSerializer):
+    priority = EnumField(PRIORITY)
+
+    class Meta(StatefulSerializer.Meta):
+        model = Ticket
+        fields = StatefulSerializer.Meta.fields + ['id', 'title', 'priority', 'reporter', 'assignee', 'updated']
+
+
+class Context:
+    """Users, request and page of tickets shared by the runs of every case."""
+
+    def __init__(self, page_size):
+        self.page = list(Ticket.objects.order_by('id')[:page_size])
+        if not self.page:
+            raise Exception('no benchmark data, run the noob command first.')
+
+        self.user = self.page[0].assignee
+        self.users = list({ticket.reporter for ticket in self.page} | {ticket.assignee for ticket in self.page})
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+        self.admin = StatefulModelAdmin(Ticket, admin.site)
+
+
+@case
+def transition(context):
+    with transaction.atomic():
+        ticket = Ticket(title='Benchmark', priority=PRIORITY.NORMAL, reporter=context.user, assignee=context.user)
+        ticket.transition(context.user, Ticket.ACTION.CREATE)
+        ticket.transition(context.user, Ticket.ACTION.START)
+        ticket.transition(context.user, Ticket.ACTION.RESOLVE)
+        transaction.set_rollback(True)
+
+
+@case
+def permitted_allowed_actions(context):
+    for ticket in Ticket.objects.filter(pk__in=[ticket.pk for ticket in context.page]):
+        ticket.get_permitted_allowed_actions(context.user)
+
+
+@case
+def permitted_allowed_actions_many(context):
+    tickets = list(Ticket.objects.filter(pk__in=[ticket.pk for ticket in context.page]))
+    Ticket.get_permitted_allowed_actions_many(tickets, context.user)
+
+
+@case
+def serializer_list(context):
+    tickets = Ticket.objects.filter(pk__in=[ticket.pk for ticket in context.page])
+    return TicketSerializer(tickets, many=True, context={'request': context.request}).data
+
+
+@case
+def all_field_serializer(context):
+    get_all_field_serializer(Ticket)(Ticket.objects.order_by('id')[:LIST_SIZE], many=True).data
+
+
+@case
+def all_field_serializer_compiled(context):
+    get_all_field_serializer(Ticket, compiled=True)(Ticket.objects.order_by('id')[:LIST_SIZE], many=True).data
+
+
+@case
+def enum_decode(context):
+    list(Ticket.objects.values_list('status', 'priority', 'labels'))
+    list(Comment.objects.values_list('priority', flat=True))
+
+
+@case
+def enum_raw(context):
+    list(Ticket.objects.raw_enums().values_list('status', 'priority', 'labels'))
+    list(Comment.objects.raw_enums().values_list('priority', flat=True))
+
+
+@lru_cache(maxsize=None)
+def _get_enum_values():
+    """(field, stored names) of the Ticket enum columns, repeated up to ENUM_VALUES per field."""
+    values = []
+    for name in ('status', 'priority'):
+        field = Ticket._meta.get_field(name)
+        names = [member.name for member in field.enum]
+        values.append((field, (names * (ENUM_VALUES // len(names) + 1))[:ENUM_VALUES]))
+    return values
+
+
+def _legacy_decode(field, value):
+    # EnumField.to_python before the decode dicts, the baseline of enum_values: members are looked up
+    # by their uuid values, so stored names raise in enum() and come back as plain strings
+    try:
+        return field.enum(value)
+    except:  # noqa: E722
+        return models.CharField.to_python(field, value)
+
+
+@case
+def enum_values_legacy(context):
+    for field, names in _get_enum_values():
+        [_legacy_decode(field, value) for value in names]
+
+
+@case
+def enum_values(context):
+    for field, names in _get_enum_values():
+        [field.from_db_value(value, None, None) for value in names]
+
+
+@case
+def state_diagram_view(context):
+    context.admin.state_diagram_view(context.request)
+
+
+@case
+def notify_user(context):
+    routing.notify_user(context.user, 'Benchmark')
+
+
+@case
+def notify_users(context):
+    routing.notify_users(context.users, 'Benchmark')
@@ -0,0 +1,102 @@
+import json
+import platform
+import statistics
+import time
+
+import django
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from benchmarks.cases import CASES, Context
+from benchmarks.models import Comment, Ticket
+
+
+class Command(BaseCommand):
+    help = 'Run the benchmark cases over the data seeded by noob and write the timings as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('cases', nargs='*', help='Case names, every case by default: {}.'.format(', '.join(CASES)))
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--output', help='JSON file, stdout by default.')
+        parser.add_argument('--compare', help='JSON file of a previous run to report regressions against.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed slowdown of the median over the compared run (0.2 is 20%%).')
+
+    def handle(self, cases, runs, warmup, page_size, output, compare, tolerance, **options):
+        unknown = set(cases).difference(CASES)
+        if unknown:
+            raise CommandError('Unknown cases: {}.'.format(', '.join(sorted(unknown))))
+
+        context = Context(page_size)
+        results = {}
+        for name in cases or CASES:
+            results[name] = self.measure(CASES[name], context, runs, warmup)
+            self.stderr.write('{}: median {:.3f}ms, {} queries'.format(
+                name, results[name]['median'] * 1000, results[name]['queries'],
+            ))
+
+        report = {
+            'meta': {
+                'timestamp': time.time(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'tickets': Ticket.objects.count(),
+                'comments': Comment.objects.count(),
+                'runs': runs,
+                'page_size': page_size,
+            },
+            'results': results,
+        }
+        content = json.dumps(report, indent=2)
+        if output:
+            with open(output, 'w') as file:
+                file.write(content)
+        else:
+            self.stdout.write(content)
+
+        if compare:
+            self.compare(results, compare, tolerance)
+
+    def measure(self, function, context, runs, warmup):
+        for _ in range(warmup):
+            function(context)
+
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(runs):
+                started = time.perf_counter()
+                function(context)
+                timings.append(time.perf_counter() - started)
+
+        return {
+            'runs': runs,
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.mean(timings),
+            'max': max(timings),
+            'queries': len(queries) // runs,
+        }
+
+    def compare(self, results, path, tolerance):
+        with open(path) as file:
+            previous = json.load(file)['results']
+
+        regressions = []
+        for name, result in results.items():
+            if name not in previous:
+                continue
+
+            ratio = result['median'] / previous[name]['median']
+            if ratio > 1 + tolerance or result['queries'] > previous[name]['queries']:
+                regressions.append('{}: median x{:.2f}, queries {} -> {}'.format(
+                    name, ratio, previous[name]['queries'], result['queries'],
+                ))
+
+        if regressions:
+            raise CommandError('Regressions against {}:\n{}'.format(path, '\n'.join(regressions)))
+
+        self.stderr.write('No regression against {}.'.format(path))
@@ -0,0 +1,89 @@
+# Generated by Django 3.0.14 on 2026-10-16 23:06
+
+import core.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ticket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', core.models._StatusField(core.models._DummyLabeledEnum, editable=False, max_length=100, storage=None)),
+                ('updated', models.DateTimeField(auto_now_add=True)),
+                ('title', models.CharField(max_length=200)),
+                ('priority', core.models.EnumField(core.models._DummyLabeledEnum, max_length=100)),
+                ('labels', core.models.MultiEnumField(core.models._DummyLabeledEnum, blank=True)),
+                ('assignee', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('reporter', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TicketLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(auto_now=True)),
+                ('status', core.models.EnumField(core.models._DummyLabeledEnum, max_length=100, null=True)),
+                ('action', core.models.EnumField(core.models._DummyLabeledEnum, max_length=100)),
+                ('stater', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actions', to='benchmarks.Ticket')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TicketLastDoer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('action', core.models.EnumField(core.models._DummyLabeledEnum, max_length=100)),
+                ('stater', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='last_doers', to='benchmarks.Ticket')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Comment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('updated_time', models.DateTimeField(auto_now=True)),
+                ('body', models.TextField()),
+                ('priority', core.models.EnumField(core.models._DummyLabeledEnum, max_length=100)),
+                ('created_by', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='benchmarks.Ticket')),
+                ('updated_by', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ticketlog',
+            index=models.Index(fields=['stater', 'action', 'timestamp'], name='benchmarks__stater__43e7a1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketlog',
+            index=models.Index(fields=['status', 'timestamp'], name='benchmarks__status_e0fd9f_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ticketlastdoer',
+            unique_together={('stater', 'action')},
+        ),
+    ]
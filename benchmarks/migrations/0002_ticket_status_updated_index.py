@@ -0,0 +1,17 @@
+# Generated by Django 3.0.14 on 2026-10-16 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('benchmarks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['status', 'updated'], name='benchmarks__status_46d254_idx'),
+        ),
+    ]
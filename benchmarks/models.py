@@ -0,0 +1,70 @@
+from django.contrib.auth.models import User
+from django.db import models
+
+from core.models import ACTION_PERMISSION, EnumField, LabeledEnum, MultiEnumField, StatefulModel, TransactionalModel
+
+
+class PRIORITY(LabeledEnum):
+    LOW = 'Low'
+    NORMAL = 'Normal'
+    HIGH = 'High'
+    URGENT = 'Urgent'
+
+
+class LABEL(LabeledEnum):
+    BUG = 'Bug'
+    FEATURE = 'Feature'
+    DOCS = 'Docs'
+    SECURITY = 'Security'
+    PERFORMANCE = 'Performance'
+
+
+class Ticket(StatefulModel):
+    class STATUS(LabeledEnum):
+        OPEN = 'Open'
+        IN_PROGRESS = 'In progress'
+        RESOLVED = 'Resolved'
+        CLOSED = 'Closed'
+
+    class ACTION(LabeledEnum):
+        CREATE = 'Create'
+        START = 'Start'
+        RESOLVE = 'Resolve'
+        REOPEN = 'Reopen'
+        CLOSE = 'Close'
+
+    TRANSITION = [
+        (None, ACTION.CREATE, STATUS.OPEN),
+        (STATUS.OPEN, ACTION.START, STATUS.IN_PROGRESS),
+        (STATUS.IN_PROGRESS, ACTION.RESOLVE, STATUS.RESOLVED),
+        (STATUS.RESOLVED, ACTION.REOPEN, STATUS.OPEN),
+        (STATUS.RESOLVED, ACTION.CLOSE, STATUS.CLOSED),
+    ]
+
+    ACTIONS_PERMISSION = {
+        ACTION.CREATE: [ACTION_PERMISSION.EVERYONE()],
+        ACTION.START: [ACTION_PERMISSION.ATTRIBUTE('assignee')],
+        ACTION.RESOLVE: [ACTION_PERMISSION.ATTRIBUTE('assignee') | ACTION_PERMISSION.LAST_DOER(ACTION.START)],
+        ACTION.REOPEN: [ACTION_PERMISSION.LAST_DOER(ACTION.CREATE)],
+        ACTION.CLOSE: [ACTION_PERMISSION.LAST_DOER(ACTION.CREATE) & ACTION_PERMISSION.ATTRIBUTE('reporter')],
+    }
+
+    title = models.CharField(max_length=200)
+    priority = EnumField(PRIORITY)
+    labels = MultiEnumField(LABEL, blank=True)
+    reporter = models.ForeignKey(User, on_delete=models.PROTECT, related_name='+')
+    assignee = models.ForeignKey(User, null=True, on_delete=models.PROTECT, related_name='+')
+
+
+class TicketLog(Ticket.action_log_class):
+    pass
+
+
+class TicketLastDoer(Ticket.last_doer_class):
+    pass
+
+
+class Comment(TransactionalModel):
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='comments')
+    body = models.TextField()
+    priority = EnumField(PRIORITY)
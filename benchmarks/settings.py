@@ -0,0 +1,24 @@
+"""Settings for the benchmark suite, ``python manage.py benchmark --settings=benchmarks.settings``.
+
+BENCHMARK_DATABASE_URL selects the database (a throwaway PostgreSQL one, e.g.
+postgres://postgres@db/benchmark), a local SQLite file by default.
+"""
+
+from config.settings import *  # noqa: F401, F403
+from config.settings import INSTALLED_APPS, env, root
+
+INSTALLED_APPS = INSTALLED_APPS + [
+    'benchmarks.apps.BenchmarksConfig',
+]
+
+DATABASES = {
+    'default': env.db('BENCHMARK_DATABASE_URL', default='sqlite:///' + root('benchmark.sqlite3')),
+}
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+PRESENCE_STORE = None
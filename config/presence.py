@@ -0,0 +1,101 @@
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+PRESENCE_TTL = getattr(settings, 'PRESENCE_TTL', 60)
+PRESENCE_LOCAL_TTL = getattr(settings, 'PRESENCE_LOCAL_TTL', 2)
+
+
+class CachePresenceStore:
+    """Open socket count per user in a Django cache, expiring unless refreshed by heartbeats.
+
+    Use a cache shared by every process (e.g. Redis); the default LocMemCache only works as an
+    in-memory stand-in for a single process.
+    """
+
+    def __init__(self, ttl, alias='default'):
+        self.ttl = ttl
+        self.cache = caches[alias]
+
+    @staticmethod
+    def _key(user_id):
+        return 'presence:{}'.format(user_id)
+
+    def connect(self, user_id):
+        key = self._key(user_id)
+        self.cache.add(key, 0, self.ttl)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, self.ttl)
+        self.cache.touch(key, self.ttl)
+
+    def heartbeat(self, user_id):
+        key = self._key(user_id)
+        if not self.cache.touch(key, self.ttl):
+            self.cache.add(key, 1, self.ttl)
+
+    def disconnect(self, user_id):
+        key = self._key(user_id)
+        try:
+            if self.cache.decr(key) <= 0:
+                self.cache.delete(key)
+        except ValueError:
+            pass
+
+    def get_online(self, user_ids):
+        counts = self.cache.get_many([self._key(user_id) for user_id in user_ids])
+        return {user_id for user_id in user_ids if counts.get(self._key(user_id), 0) > 0}
+
+
+@lru_cache(maxsize=None)
+def get_presence_store():
+    """Store configured by PRESENCE_STORE, None when presence is not tracked."""
+    path = getattr(settings, 'PRESENCE_STORE', None)
+    return import_string(path)(ttl=PRESENCE_TTL) if path else None
+
+
+_local_cache = {}
+
+
+def forget(user_id):
+    _local_cache.pop(user_id, None)
+
+
+def get_online_user_ids(user_ids):
+    """Online subset of ``user_ids``, answered from a short-lived local cache when possible.
+
+    Every user counts as online when presence is not tracked.
+    """
+    store = get_presence_store()
+    if store is None:
+        return set(user_ids)
+
+    now = time.monotonic()
+    online = set()
+    missing = []
+    for user_id in user_ids:
+        cached = _local_cache.get(user_id)
+        if cached and cached[1] > now:
+            if cached[0]:
+                online.add(user_id)
+        else:
+            missing.append(user_id)
+
+    if missing:
+        if len(_local_cache) > 10000:
+            _local_cache.clear()
+
+        found = store.get_online(missing)
+        for user_id in missing:
+            _local_cache[user_id] = (user_id in found, now + PRESENCE_LOCAL_TTL)
+        online |= found
+
+    return online
+
+
+def is_online(user):
+    return user.id in get_online_user_ids([user.id])
@@ -1,20 +1,102 @@
+import asyncio
 import datetime
 import json
+import time
+from collections import Counter
 from enum import Enum
+from urllib.parse import parse_qs
 
 import channels
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.routing import ProtocolTypeRouter, URLRouter
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.conf.urls import url
 
+from config.presence import PRESENCE_TTL, forget, get_online_user_ids, get_presence_store, is_online
+from core import live
+from core.models import StatefulModel
+
+COALESCE_STATS = Counter()
+
+
+class _Coalescer:
+    """Hold push_data events per topic for ``window`` seconds and send only the latest one.
+
+    Events flagged with ``merge`` are merged into the pending payload instead of replacing it.
+    """
+
+    def __init__(self, window, send):
+        self.window = window
+        self.send = send
+        self.pending = {}
+        self.tasks = {}
+        self.stats = Counter()
+
+    def _count(self, key):
+        self.stats[key] += 1
+        COALESCE_STATS[key] += 1
+
+    async def push(self, topic, event):
+        self._count('received')
+        if topic in self.pending:
+            if event.get('merge'):
+                payload = live.decode_payload(self.pending[topic])
+                payload.update(live.decode_payload(event))
+                self.pending[topic] = dict(event, text=json.dumps(payload))
+                self._count('merged')
+            else:
+                self.pending[topic] = dict(event)
+                self._count('dropped')
+            return
+
+        self.pending[topic] = dict(event)
+        self.tasks[topic] = asyncio.ensure_future(self._flush_later(topic))
+
+    async def _flush_later(self, topic):
+        await asyncio.sleep(self.window)
+        self.tasks.pop(topic, None)
+        event = self.pending.pop(topic)
+        self._count('sent')
+        await self.send(event)
+
+    def cancel(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+        self.pending.clear()
+
+
+def get_coalesce_stats():
+    return dict(COALESCE_STATS)
+
 
 class UserConsumer(AsyncWebsocketConsumer):
+    """Per-user socket, ``?encoding=msgpack`` and ``&compression=zlib`` select the wire format.
+
+    Clients receive status changes of stateful models publishing them (PUBLISH_TRANSITIONS) by sending
+    ``{"type": "subscribe", "model": "app_label.model_name", "pk": ...}``, without ``pk`` for every
+    object of the model, and stop with the same message typed ``unsubscribe``.
+    """
+
+    coalesce_window = getattr(settings, 'PUSH_DATA_COALESCE_WINDOW', 0)
+
     async def connect(self):
         user_id = self.scope['user'].id
         if not user_id:
             await self.close()
+            return
+
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        encoding = query.get('encoding', ['json'])[0]
+        encoding = encoding if encoding == 'msgpack' and live.msgpack else 'json'
+        if query.get('compression', [''])[0] == 'zlib':
+            encoding += '+zlib'
+        self.encoding = encoding
 
         self.group_name = 'user_{}'.format(user_id)
         await self.channel_layer.group_add(
@@ -22,19 +104,108 @@ class UserConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
+        self.subscriptions = set()
+        self.coalescer = _Coalescer(self.coalesce_window, self.send_push_data) if self.coalesce_window else None
+        self.presence = get_presence_store()
+        if self.presence:
+            await sync_to_async(self.presence.connect)(user_id)
+            forget(user_id)
+            self.heartbeat_task = asyncio.ensure_future(self.heartbeat(user_id))
+
         await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
-        )
+        if not hasattr(self, 'group_name'):
+            return
+
+        if self.coalescer:
+            self.coalescer.cancel()
+
+        if self.presence:
+            self.heartbeat_task.cancel()
+            await sync_to_async(self.presence.disconnect)(self.scope['user'].id)
+            forget(self.scope['user'].id)
+
+        for group_name in [self.group_name, *self.subscriptions]:
+            await self.channel_layer.group_discard(
+                group_name,
+                self.channel_name
+            )
+
+    async def heartbeat(self, user_id):
+        while True:
+            await asyncio.sleep(PRESENCE_TTL / 2)
+            await sync_to_async(self.presence.heartbeat)(user_id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            content = json.loads(text_data or bytes_data)
+        except ValueError:
+            content = {}
+
+        if not isinstance(content, dict):
+            content = {}
+
+        if content.get('type') not in ('subscribe', 'unsubscribe') or not isinstance(content.get('model'), str):
+            await self.send_frames({'type': 'error', 'message': 'invalid message'})
+            return
+
+        group_name = await database_sync_to_async(self.get_subscription_group)(content)
+        if group_name is None:
+            await self.send_frames({'type': 'error', 'message': 'subscription is not permitted'})
+            return
+
+        if content['type'] == 'subscribe':
+            await self.channel_layer.group_add(group_name, self.channel_name)
+            self.subscriptions.add(group_name)
+        elif group_name in self.subscriptions:
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+            self.subscriptions.discard(group_name)
+
+        await self.send_frames({'type': content['type'] + 'd', 'model': content['model'], 'pk': content.get('pk')})
+
+    def get_subscription_group(self, content):
+        try:
+            model = apps.get_model(content['model'])
+        except (LookupError, ValueError, TypeError):
+            return None
+
+        user = self.scope['user']
+        if not issubclass(model, StatefulModel) or not user.has_perm(
+                '{}.view_{}'.format(model._meta.app_label, model._meta.model_name)):
+            return None
+
+        pk = content.get('pk')
+        if pk is None:
+            return live.model_group_name(model)
+
+        try:
+            return live.object_group_name(model, model._meta.pk.to_python(pk))
+        except ValidationError:
+            return None
 
     async def notification(self, event):
-        await self.send(text_data=json.dumps(event))
+        await self.send_frames(event)
+
+    async def status_change(self, event):
+        await self.send_frames(event)
 
     async def push_data(self, event):
-        await self.send(text_data=json.dumps(event))
+        topic = event.get('topic')
+        if self.coalescer and topic is not None:
+            await self.coalescer.push(topic, event)
+        else:
+            await self.send_push_data(event)
+
+    async def send_push_data(self, event):
+        await self.send_frames(event)
+
+    async def send_frames(self, event):
+        frame = live.encode_frame(event.get('text') or json.dumps(event), self.encoding)
+        if isinstance(frame, str):
+            await self.send(text_data=frame)
+        else:
+            await self.send(bytes_data=frame)
 
 
 application = ProtocolTypeRouter({
@@ -53,24 +224,106 @@ class NOTI_COLOR(Enum):
     GREEN = 'green'
 
 
+async def _agroup_send(group_name, data):
+    channel_layer = channels.layers.get_channel_layer()
+    await channel_layer.group_send(group_name, data)
+
+
 def _group_send(group_name, data):
+    async_to_sync(_agroup_send)(group_name, data)
+
+
+FAN_OUT_CONCURRENCY = 100
+
+
+async def _agroup_send_many(group_names, data):
+    """Send the same message to every group concurrently, returning delivery stats."""
     channel_layer = channels.layers.get_channel_layer()
-    group_send = async_to_sync(channel_layer.group_send)
-    group_send(group_name, data)
+    semaphore = asyncio.Semaphore(FAN_OUT_CONCURRENCY)
+
+    async def send(group_name):
+        async with semaphore:
+            await channel_layer.group_send(group_name, data)
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(send(group_name) for group_name in group_names), return_exceptions=True)
+    failed = sum(1 for result in results if isinstance(result, Exception))
+    return {
+        'groups': len(group_names),
+        'sent': len(group_names) - failed,
+        'failed': failed,
+        'seconds': time.monotonic() - started,
+    }
+
+
+async def _agroup_send_users(users, data):
+    """Fan ``data`` out to the online users only, counting the offline ones as skipped."""
+    user_ids = list(dict.fromkeys(user.id for user in users))
+    online = await sync_to_async(get_online_user_ids)(user_ids)
+    stats = await _agroup_send_many(['user_{}'.format(user_id) for user_id in user_ids if user_id in online], data)
+    stats['skipped'] = len(user_ids) - len(online)
+    return stats
+
+
+async def ais_online(user):
+    return await sync_to_async(is_online)(user)
+
+
+def _notification(message, color):
+    return {
+        'type': 'notification',
+        'message': message,
+        'color': color.value,
+        'timestamp': datetime.datetime.now().timestamp()
+    }
 
 
 def notify_user(user, message, color: NOTI_COLOR = NOTI_COLOR.BLACK):
-    _group_send(
-        'user_{}'.format(user.id),
-        {
-            'type': 'notification',
-            'message': message,
-            'color': color.value,
-            'timestamp': datetime.datetime.now().timestamp()
-        }
-    )
-
-
-def push_data(user, data: dict):
+    if is_online(user):
+        _group_send('user_{}'.format(user.id), live.message(_notification(message, color)))
+
+
+async def anotify_user(user, message, color: NOTI_COLOR = NOTI_COLOR.BLACK):
+    if await ais_online(user):
+        await _agroup_send('user_{}'.format(user.id), live.message(_notification(message, color)))
+
+
+def notify_users(users, message, color: NOTI_COLOR = NOTI_COLOR.BLACK):
+    return async_to_sync(anotify_users)(users, message, color)
+
+
+async def anotify_users(users, message, color: NOTI_COLOR = NOTI_COLOR.BLACK):
+    return await _agroup_send_users(users, live.message(_notification(message, color)))
+
+
+def push_data(user, data: dict, topic=None, merge=False):
+    """Push ``data`` to the user's sockets.
+
+    Pushes sharing a ``topic`` (e.g. an object id) may be coalesced by the consumers, keeping only
+    the latest payload, or merging them with ``merge=True``, per PUSH_DATA_COALESCE_WINDOW.
+    """
+    if is_online(user):
+        _group_send('user_{}'.format(user.id), _push_data(data, topic, merge))
+
+
+async def apush_data(user, data: dict, topic=None, merge=False):
+    if await ais_online(user):
+        await _agroup_send('user_{}'.format(user.id), _push_data(data, topic, merge))
+
+
+def _push_data(data, topic, merge):
     data['type'] = 'push_data'
-    _group_send('user_{}'.format(user.id), data)
+    if topic is None:
+        return live.message(data)
+
+    data['topic'] = topic
+    data['merge'] = merge
+    return live.message(data, topic=topic, merge=merge)
+
+
+def push_data_many(users, data: dict, topic=None, merge=False):
+    return async_to_sync(apush_data_many)(users, data, topic, merge)
+
+
+async def apush_data_many(users, data: dict, topic=None, merge=False):
+    return await _agroup_send_users(users, _push_data(dict(data), topic, merge))
@@ -146,6 +146,19 @@ REST_FRAMEWORK = {
 
 ASGI_APPLICATION = 'config.routing.application'
 
+# seconds to hold push_data events sharing a topic per socket, 0 disables coalescing
+PUSH_DATA_COALESCE_WINDOW = env.float('PUSH_DATA_COALESCE_WINDOW', default=0)
+
+# dotted path of the presence store (e.g. config.presence.CachePresenceStore with a shared cache),
+# notifications to users without open sockets are skipped when set
+PRESENCE_STORE = env('PRESENCE_STORE', default=None)
+
+# socket frames of at least this many bytes are zlib compressed for sockets asking for it
+WS_COMPRESS_THRESHOLD = env.int('WS_COMPRESS_THRESHOLD', default=4096)
+
+# bytes of msgpack and zlib socket frames each worker keeps for the sockets sharing a message
+WS_FRAME_CACHE_SIZE = env.int('WS_FRAME_CACHE_SIZE', default=1024 * 1024)
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
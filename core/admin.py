@@ -1,13 +1,22 @@
+import hashlib
 import json
 from collections import defaultdict
 from functools import update_wrapper
 
 from django import forms
-from django.contrib.admin import ModelAdmin
+from django.contrib.admin import ChoicesFieldListFilter, FieldListFilter, ModelAdmin
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, QuerySet
+from django.http import Http404
 from django.shortcuts import render
 from django.urls import path
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
 
-from core.models import _EnumFormField
+from core.models import TransactionalModel, _EnumFormField, _StatusField
 
 
 class ActionButtonsAdminMixin:
@@ -32,16 +41,84 @@ class StatefulModelAdminForm(forms.ModelForm):
         )
 
 
+class StatusFieldListFilter(ChoicesFieldListFilter):
+    """Status filter showing the number of objects in each status, see get_status_populations."""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.populations = get_status_populations(model, getattr(model_admin, 'status_count_ttl', 30))
+
+    def choices(self, changelist):
+        choices = list(super().choices(changelist))
+        for choice, (lookup, title) in zip(choices[1:], self.field.flatchoices):
+            choice['display'] = '{} ({})'.format(title, self.populations.get(lookup, 0))
+        return choices
+
+
+FieldListFilter.register(lambda field: isinstance(field, _StatusField), StatusFieldListFilter, take_priority=True)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator using the planner's row estimate of unfiltered PostgreSQL tables above ``estimate_threshold``."""
+
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            connection = connections[queryset.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                                   [connection.ops.quote_name(queryset.model._meta.db_table)])
+                    row = cursor.fetchone()
+                if row and row[0] >= self.estimate_threshold:
+                    return int(row[0])
+
+        return super().count
+
+
 class StatefulModelAdmin(ActionButtonsAdminMixin, ModelAdmin):
     form = StatefulModelAdminForm
+    list_filter = ('status',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # seconds the transition counts and status populations of the diagram overlay are cached
+    diagram_traffic_ttl = 30
+
+    # seconds the status counts of the status filter are cached
+    status_count_ttl = 30
 
     def get_readonly_fields(self, request, obj=None):
         return super().get_readonly_fields(request, obj) + ('status',)
 
+    def get_list_select_related(self, request):
+        list_select_related = super().get_list_select_related(request)
+        if list_select_related is not False or not issubclass(self.model, TransactionalModel):
+            return list_select_related
+
+        # listing them replaces Django's own selection of the foreign keys in list_display
+        related = ['created_by', 'updated_by']
+        for name in self.get_list_display(request):
+            try:
+                field = self.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+
+            if field.many_to_one and name not in related:
+                related.append(name)
+        return related
+
     def get_change_list_buttons(self):
-        return [
+        buttons = [
             dict(link='diagram/', name='Diagram'),
+            dict(link='diagram/?traffic=1', name='Traffic'),
         ]
+        if self.model._get_state_stat_class() is not None:
+            buttons.append(dict(link='stats/', name='Stats'))
+        return buttons
 
     def get_urls(self):
         info = self.model._meta.app_label, self.model._meta.model_name
@@ -57,6 +134,9 @@ class StatefulModelAdmin(ActionButtonsAdminMixin, ModelAdmin):
         urlpatterns.insert(
             2, path('diagram/', wrap(self.state_diagram_view), name='%s_%s_diagram' % info)
         )
+        urlpatterns.insert(
+            3, path('stats/', wrap(self.state_stats_view), name='%s_%s_stats' % info)
+        )
         return urlpatterns
 
     def save_model(self, request, obj, form, change):
@@ -64,51 +144,159 @@ class StatefulModelAdmin(ActionButtonsAdminMixin, ModelAdmin):
         action = self.model.ACTION(form.cleaned_data.get('action'))
         obj.transition(user, action)
 
-    def state_diagram_view(self, request):
+    def state_stats_view(self, request):
         model = self.model
-        nodes = []
-        edges = []
-        transitions = defaultdict(list)
-        node_visited = set()
-        nodes.append({
-            'id': 'initial',
-            'shape': 'circle',
-            'fixed': True,
+        if model._get_state_stat_class() is None:
+            raise Http404('{} has no state stat class.'.format(model._meta.label))
+
+        since = self._get_date_param(request, 'since')
+        until = self._get_date_param(request, 'until')
+        time_in_status = model.get_time_in_status(since, until)
+        throughput = defaultdict(dict)
+        for date, action, count in model.get_action_throughput(since, until):
+            throughput[date][action] = count
+
+        return render(request, 'stateful_model_stats.html', {
+            'model_label': model._meta.label,
+            'since': since or '',
+            'until': until or '',
+            'statuses': [
+                dict(
+                    label=status.text,
+                    count=time_in_status[status]['count'],
+                    average_hours=(time_in_status[status]['average'] or 0) / 3600,
+                    total_hours=time_in_status[status]['seconds'] / 3600,
+                )
+                for status in model.STATUS
+                if status in time_in_status
+            ],
+            'actions': list(model.ACTION),
+            'throughput': [
+                (date, [counts.get(action, 0) for action in model.ACTION])
+                for date, counts in sorted(throughput.items())
+            ],
         })
-        for state in model.STATUS:
-            nodes.append({
-                'id': state.value,
-                'label': state.text,
-                'shape': 'box'
-            })
-        for status_from, action, status_to in model.TRANSITION:
-            edges.append({
-                'from': status_from.value if status_from else 'initial',
-                'to': status_to.value,
-                'arrows': 'to',
-                'label': action.name
-            })
-
-            status_from_id = status_from.value if status_from else 'initial'
-            status_to_id = status_to.value if status_to else 'initial'
-
-            node_visited.add(status_from_id)
-            node_visited.add(status_to_id)
-
-            transitions[(status_from_id, status_to_id)].append(action.name)
-
-        nodes = list(filter(lambda x: x['id'] in node_visited, nodes))
-        js_nodes = json.dumps(nodes)
-        for state in nodes:
-            action_list = []
-            for to in nodes:
-                action_list.append(transitions[(state.get('id'), to.get('id'))])
-            state['action_list'] = action_list
+
+    @staticmethod
+    def _get_date_param(request, name):
+        """YYYY-MM-DD query parameter as a date, None when missing or invalid."""
+        try:
+            return parse_date(request.GET.get(name) or '')
+        except ValueError:
+            return None
+
+    def state_diagram_view(self, request):
+        model = self.model
+        diagram = get_state_diagram(model)
+        nodes, edges = diagram['nodes'], diagram['edges']
+        traffic = request.GET.get('traffic') == '1'
+        if traffic:
+            edge_counts, populations = get_state_traffic(model, self.diagram_traffic_ttl)
+            nodes = [
+                dict(node, label='{} ({})'.format(node['label'], populations.get(node['id'], 0)))
+                if 'label' in node else node
+                for node in nodes
+            ]
+            edges = [
+                dict(edge, label='{} ({})'.format(edge['label'], count), value=count)
+                for edge, count in (
+                    (edge, edge_counts.get((getattr(status_from, 'name', None), action.name), 0))
+                    for edge, (status_from, action, status_to) in zip(edges, model.TRANSITION)
+                )
+            ]
 
         return render(request, 'stateful_model_diagram.html', {
             'model_label': model._meta.label,
-            'nodes': js_nodes,
+            'nodes': json.dumps(nodes),
             'edges': json.dumps(edges),
-            'states': nodes,
-            'transitions': transitions,
+            'states': diagram['states'],
+            'traffic': traffic,
+        })
+
+
+_STATE_DIAGRAMS = {}
+
+
+def get_state_diagram(model):
+    """Nodes, edges and transition table of the model, built once per TRANSITION and STATUS."""
+    digest = hashlib.sha1(repr((
+        [(status.name, status.text) for status in model.STATUS],
+        [(getattr(status_from, 'name', None), action.name, status_to.name)
+         for status_from, action, status_to in model.TRANSITION],
+    )).encode()).hexdigest()
+    key = model._meta.label, digest
+    if key not in _STATE_DIAGRAMS:
+        _STATE_DIAGRAMS[key] = _build_state_diagram(model)
+    return _STATE_DIAGRAMS[key]
+
+
+def _build_state_diagram(model):
+    nodes = []
+    edges = []
+    transitions = defaultdict(list)
+    node_visited = set()
+    nodes.append({
+        'id': 'initial',
+        'shape': 'circle',
+        'fixed': True,
+    })
+    for state in model.STATUS:
+        nodes.append({
+            'id': state.value,
+            'label': state.text,
+            'shape': 'box'
         })
+    for status_from, action, status_to in model.TRANSITION:
+        status_from_id = status_from.value if status_from else 'initial'
+        status_to_id = status_to.value if status_to else 'initial'
+        edges.append({
+            'from': status_from_id,
+            'to': status_to_id,
+            'arrows': 'to',
+            'label': action.name
+        })
+
+        node_visited.add(status_from_id)
+        node_visited.add(status_to_id)
+
+        transitions[(status_from_id, status_to_id)].append(action.name)
+
+    nodes = [node for node in nodes if node['id'] in node_visited]
+    states = [
+        dict(node, action_list=[transitions[(node['id'], to['id'])] for to in nodes])
+        for node in nodes
+    ]
+    return {
+        'nodes': nodes,
+        'edges': edges,
+        'states': states,
+    }
+
+
+def get_state_traffic(model, ttl=30):
+    """({(status name, action name): logs}, {status name: objects}), one grouped query each, cached ``ttl`` seconds.
+
+    Members are cached by name, their values differ between processes.
+    """
+    key = 'state_traffic:{}'.format(model._meta.label)
+    edge_counts = cache.get(key)
+    if edge_counts is None:
+        logs = model._get_log_class().objects.values_list('status', 'action').annotate(
+            count=Count('id'),
+        ).order_by()
+        edge_counts = {(getattr(status, 'name', None), action.name): count for status, action, count in logs}
+        cache.set(key, edge_counts, ttl)
+
+    return edge_counts, get_status_populations(model, ttl)
+
+
+def get_status_populations(model, ttl=30):
+    """{status name: objects} from one grouped query, cached ``ttl`` seconds."""
+    key = 'status_populations:{}'.format(model._meta.label)
+    populations = cache.get(key)
+    if populations is None:
+        rows = model.objects.values_list('status').annotate(count=Count('pk')).order_by()
+        populations = {status.name: count for status, count in rows}
+        cache.set(key, populations, ttl)
+
+    return populations
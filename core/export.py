@@ -0,0 +1,123 @@
+"""Streaming NDJSON/CSV export of querysets in constant memory.
+
+Rows are read with a server-side cursor, enum fields written by name and users by username.
+"""
+
+import csv
+import datetime
+import json
+import zlib
+from enum import Enum
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from core.models import _MultiEnumMixin
+
+FORMATS = ('ndjson', 'csv')
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    """JSON encoder of exported rows, enum members by name and datetimes to the microsecond."""
+
+    def encode(self, o):
+        return super().encode({key: _to_name(value) for key, value in o.items()})
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _to_name(value):
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, list) and value and isinstance(value[0], Enum):
+        return [member.name for member in value]
+    return value
+
+
+def get_columns(model):
+    """(column name, values() lookup) of the concrete fields, users by username."""
+    user_model = get_user_model()
+    columns = []
+    for field in model._meta.concrete_fields:
+        if field.is_relation and field.related_model is user_model:
+            columns.append((field.name, '{}__{}'.format(field.name, user_model.USERNAME_FIELD)))
+        elif field.is_relation:
+            columns.append((field.attname, field.attname))
+        else:
+            columns.append((field.name, field.name))
+    return columns
+
+
+def iter_rows(queryset, chunk_size=2000):
+    """Dicts of the exported columns, fetched ``chunk_size`` rows at a time."""
+    columns = get_columns(queryset.model)
+    names = [name for name, lookup in columns]
+    rows = queryset.values_list(*[lookup for name, lookup in columns]).order_by('pk')
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield dict(zip(names, row))
+
+
+def iter_ndjson(queryset, chunk_size=2000):
+    for row in iter_rows(queryset, chunk_size):
+        yield json.dumps(row, cls=ExportEncoder) + '\n'
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset, chunk_size=2000):
+    columns = get_columns(queryset.model)
+    multi_enums = {
+        field.name for field in queryset.model._meta.concrete_fields if isinstance(field, _MultiEnumMixin)
+    }
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, lookup in columns])
+    for row in iter_rows(queryset, chunk_size):
+        yield writer.writerow([
+            ','.join(_to_name(value) or []) if name in multi_enums else _to_name(value)
+            for name, value in row.items()
+        ])
+
+
+def iter_export(queryset, export_format='ndjson', compress=False, chunk_size=2000):
+    """Encoded chunks of the export, gzipped bytes with ``compress``, else text."""
+    assert export_format in FORMATS
+    chunks = iter_ndjson(queryset, chunk_size) if export_format == 'ndjson' else iter_csv(queryset, chunk_size)
+    return _gzip(chunks) if compress else chunks
+
+
+def _gzip(chunks, flush_size=64 * 1024):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        pending += len(chunk)
+        if data:
+            yield data
+        if pending >= flush_size:
+            yield compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+
+    yield compressor.flush()
+
+
+def export_response(queryset, filename, export_format='ndjson', compress=False, chunk_size=2000):
+    """StreamingHttpResponse downloading the export as ``filename`` (plus .gz with ``compress``)."""
+    filename = '{}.{}'.format(filename, export_format) + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        iter_export(queryset, export_format, compress, chunk_size),
+        content_type='application/gzip' if compress else CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
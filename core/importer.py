@@ -0,0 +1,326 @@
+"""Chunked loading of NDJSON/CSV rows, as written by core.export, into a model and its action logs.
+
+Rows are validated and written as is, bypassing save() and its hooks: with COPY on PostgreSQL,
+an executemany() of one INSERT elsewhere.
+"""
+
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.models import EnumField, LabeledEnum, _MultiEnumMixin, _StatusField
+
+
+class InvalidRow(Exception):
+    pass
+
+
+def iter_file_rows(file, import_format='ndjson'):
+    """(line number, row dict) of an open text file, empty CSV cells read as None."""
+    if import_format == 'ndjson':
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise InvalidRow('line {}: {}'.format(number, e))
+            if not isinstance(row, dict):
+                raise InvalidRow('line {}: not a JSON object.'.format(number))
+            yield number, row
+        return
+
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield reader.line_num, {key: None if value == '' else value for key, value in row.items()}
+
+
+class RowLoader:
+    """Database values of the concrete fields of ``model`` from exported rows.
+
+    Columns are matched by field name or attname, users by username under the field name. Missing
+    columns take the field default, the current time for auto_now fields, or None.
+    """
+
+    def __init__(self, model, keys):
+        self.model = model
+        self.user_model = get_user_model()
+        self.user_ids = {}
+        self.columns = []
+        for field in model._meta.concrete_fields:
+            if field.is_relation and field.related_model is self.user_model and field.name in keys:
+                self.columns.append((field, field.name, self.get_user_id))
+            elif field.attname in keys or field.name in keys:
+                key = field.attname if field.attname in keys else field.name
+                self.columns.append((field, key, self.get_value))
+            elif field.primary_key:
+                continue
+            elif field.has_default() or getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                self.columns.append((field, None, self.get_default))
+            elif field.null:
+                self.columns.append((field, None, lambda field, value: None))
+            else:
+                raise InvalidRow('{} column is missing.'.format(field.name))
+
+        self.attnames = [field.attname for field, key, getter in self.columns]
+        pk_attname = model._meta.pk.attname
+        self.pk_index = self.attnames.index(pk_attname) if pk_attname in self.attnames else None
+        state_machine = getattr(model, 'state_machine', None)
+        self.reachable = state_machine.get_reachable_statuses() if state_machine else set()
+
+    def load(self, numbered_rows):
+        """[(line number, values)] of a chunk, values in the order of ``attnames``."""
+        self.fetch_user_ids(numbered_rows)
+        loaded = []
+        for number, row in numbered_rows:
+            try:
+                loaded.append((number, tuple(
+                    getter(field, row.get(key) if key else None)
+                    for field, key, getter in self.columns
+                )))
+            except (InvalidRow, ValidationError, ValueError, TypeError) as e:
+                raise InvalidRow('line {}: {}'.format(number, '; '.join(getattr(e, 'messages', [str(e)]))))
+        return loaded
+
+    def fetch_user_ids(self, numbered_rows):
+        username_field = self.user_model.USERNAME_FIELD
+        usernames = {
+            row.get(key)
+            for field, key, getter in self.columns if getter == self.get_user_id
+            for number, row in numbered_rows
+        }
+        usernames.difference_update(self.user_ids, {None})
+        if usernames:
+            self.user_ids.update(self.user_model.objects.filter(
+                **{'{}__in'.format(username_field): usernames}
+            ).values_list(username_field, 'pk'))
+
+    def get_user_id(self, field, username):
+        if username is None:
+            return None
+        if username not in self.user_ids:
+            raise InvalidRow('{} is not a user.'.format(username))
+        return self.user_ids[username]
+
+    def get_value(self, field, value):
+        if value is None and not field.null and field.empty_strings_allowed:
+            value = ''
+
+        if field.is_relation:
+            value = field.target_field.to_python(value)
+        else:
+            value = field.to_python(value)
+
+        if value is None:
+            if not field.null:
+                raise InvalidRow('{} cannot be empty.'.format(field.name))
+            return value
+
+        if isinstance(field, EnumField) and not isinstance(value, LabeledEnum):
+            raise InvalidRow('"{}" is not a valid {}.'.format(value, field.enum.__name__))
+
+        if isinstance(field, _MultiEnumMixin) and None in (value or []):
+            raise InvalidRow('{} has an invalid {}.'.format(field.name, field.enum.__name__))
+
+        if isinstance(field, _StatusField) and value not in self.reachable:
+            raise InvalidRow('{} is unreachable from the initial state.'.format(value.name))
+
+        return value
+
+    def get_default(self, field, value):
+        return field.get_default() if field.has_default() else timezone.now()
+
+
+def write_rows(model, attnames, rows, using='default'):
+    """Insert value tuples into the table of ``model``, COPY on PostgreSQL."""
+    connection = connections[using]
+    fields_by_attname = {field.attname: field for field in model._meta.concrete_fields}
+    fields = [fields_by_attname[attname] for attname in attnames]
+    rows = [[field.get_db_prep_save(value, connection) for field, value in zip(fields, row)] for row in rows]
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            data = io.StringIO(''.join(','.join(map(_to_copy_value, row)) + '\n' for row in rows))
+            cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(table, columns), data)
+        else:
+            cursor.executemany('INSERT INTO {} ({}) VALUES ({})'.format(
+                table, columns, ', '.join(['%s'] * len(fields)),
+            ), rows)
+
+
+def _to_copy_value(value):
+    """CSV cell of COPY, unquoted empty for NULL and every other value quoted."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, (list, tuple)):
+        value = '{%s}' % ','.join(
+            'NULL' if v is None else '"{}"'.format(str(v).replace('\\', '\\\\').replace('"', '\\"'))
+            for v in value
+        )
+    elif hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return '"{}"'.format(str(value).replace('"', '""'))
+
+
+def reset_sequences(models, using='default'):
+    connection = connections[using]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def load_rows(model, numbered_rows, chunk_size=2000, using='default', on_chunk=None):
+    """Validate and write (line number, row dict) pairs in chunks, returns the loader.
+
+    ``on_chunk(loader, loaded)`` is called with every validated chunk before it is written.
+    """
+    numbered_rows = iter(numbered_rows)
+    loader = None
+    while True:
+        chunk = list(islice(numbered_rows, chunk_size))
+        if not chunk:
+            return loader
+
+        if loader is None:
+            loader = RowLoader(model, set().union(*(row.keys() for number, row in chunk)))
+        loaded = loader.load(chunk)
+        if on_chunk:
+            on_chunk(loader, loaded)
+        write_rows(model, loader.attnames, [values for number, values in loaded], using)
+
+
+class StatefulImport:
+    """Bulk import of a stateful model and its action logs, in one transaction.
+
+    Statuses must be reachable in TRANSITION, each imported log must be an edge of it continuing
+    the previous log of its object in the file, and the history of an object must end in its status. Objects
+    without imported logs get the shortest path to their status as logs of ``synthesize_user``,
+    at their ``updated`` time. The last doer table, if any, is rebuilt for the imported objects.
+    """
+
+    def __init__(self, model, chunk_size=2000, synthesize_user=None, using='default', progress=None):
+        self.model = model
+        self.log_class = model._get_log_class()
+        self.chunk_size = chunk_size
+        self.synthesize_user = synthesize_user
+        self.using = using
+        self.progress = progress
+        self.objects = {}
+        self.history = {}
+        self.counts = {}
+
+    def run(self, objects, logs=None):
+        with transaction.atomic(using=self.using):
+            tracked = logs is not None or self.synthesize_user is not None
+            self.load(self.model, objects, self.track_objects if tracked else None)
+            if logs is not None:
+                self.load(self.log_class, logs, self.check_logs)
+                for pk, (status, updated) in self.objects.items():
+                    if pk in self.history and self.history[pk] != status:
+                        raise InvalidRow('history of {} {} ends in {}, not in its status {}.'.format(
+                            self.model._meta.object_name, pk, self.history[pk].name, status.name,
+                        ))
+
+            if self.synthesize_user is not None:
+                self.load(self.log_class, self.synthesize_logs(), None)
+
+            if self.history:
+                self.rebuild_last_doers()
+
+            reset_sequences([self.model, self.log_class], self.using)
+        return self.counts
+
+    def load(self, model, numbered_rows, validate):
+        started = time.monotonic()
+        label = model._meta.label
+        self.counts.setdefault(label, 0)
+
+        def on_chunk(loader, loaded):
+            if validate:
+                validate(loader, loaded)
+            self.counts[label] += len(loaded)
+            if self.progress:
+                self.progress(label, self.counts[label], time.monotonic() - started)
+
+        load_rows(model, numbered_rows, self.chunk_size, self.using, on_chunk)
+
+    def track_objects(self, loader, loaded):
+        if loader.pk_index is None:
+            if self.synthesize_user is None:
+                return
+            raise InvalidRow('{} column is needed to synthesize logs.'.format(self.model._meta.pk.name))
+
+        status_index = loader.attnames.index('status')
+        updated_index = loader.attnames.index('updated')
+        for number, values in loaded:
+            self.objects[values[loader.pk_index]] = values[status_index], values[updated_index]
+
+    def check_logs(self, loader, loaded):
+        state_machine = self.model.state_machine
+        stater_index, status_index, action_index = (
+            loader.attnames.index(attname) for attname in ('stater_id', 'status', 'action')
+        )
+        for number, values in loaded:
+            stater_id, status, action = values[stater_index], values[status_index], values[action_index]
+            next_status = state_machine.get_next_status(status, action)
+            if next_status is None:
+                raise InvalidRow('line {}: {} is not allowed from {}.'.format(
+                    number, action.name, getattr(status, 'name', 'the initial state'),
+                ))
+
+            if stater_id in self.history and self.history[stater_id] != status:
+                raise InvalidRow('line {}: {} leaves {}, the previous log of {} {} led to {}.'.format(
+                    number, action.name, getattr(status, 'name', 'the initial state'),
+                    self.model._meta.object_name, stater_id, self.history[stater_id].name,
+                ))
+            self.history[stater_id] = next_status
+
+    def synthesize_logs(self):
+        paths = self.model.state_machine.get_paths()
+        number = 0
+        for pk, (status, updated) in self.objects.items():
+            if pk in self.history:
+                continue
+
+            self.history[pk] = status
+            for log_status, action in paths[status]:
+                number += 1
+                yield number, {
+                    'timestamp': updated,
+                    'stater_id': pk,
+                    'status': log_status,
+                    'user_id': self.synthesize_user.pk,
+                    'action': action,
+                }
+
+    def rebuild_last_doers(self):
+        last_doer_class = self.model._get_last_doer_class()
+        if last_doer_class is None:
+            return
+
+        pks = iter(self.history)
+        while True:
+            chunk = list(islice(pks, self.chunk_size))
+            if not chunk:
+                return
+
+            last_doer_class.objects.filter(stater_id__in=chunk).delete()
+            last_doer_class.objects.bulk_create(
+                last_doer_class(stater_id=stater_id, action=action, user_id=user_id, timestamp=timestamp)
+                for stater_id, action, user_id, timestamp in self.model._get_last_logs(
+                    stater_id__in=chunk,
+                ).values_list('stater_id', 'action', 'user_id', 'timestamp')
+            )
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import zlib
+from collections import OrderedDict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# binary frames start with a flag byte, text frames are always plain JSON
+FRAME_ZLIB = 1
+FRAME_JSON = 2
+
+WS_COMPRESS_THRESHOLD = getattr(settings, 'WS_COMPRESS_THRESHOLD', 4096)
+
+
+# ============================================================================= WIRE ENCODING
+class _FrameCache:
+    """LRU of derived frames keyed by (text, encoding), bounded by the bytes of texts and frames."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.frames = OrderedDict()
+
+    def get(self, key):
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.frames.move_to_end(key)
+        return frame
+
+    def set(self, key, frame):
+        entry_size = len(key[0]) + len(frame)
+        if entry_size > self.max_size:
+            return
+
+        self.frames[key] = frame
+        self.size += entry_size
+        while self.size > self.max_size:
+            (text, encoding), evicted = self.frames.popitem(last=False)
+            self.size -= len(text) + len(evicted)
+
+
+# bytes of derived frames kept per process, sockets of a worker receiving the same message share them
+_frame_cache = _FrameCache(getattr(settings, 'WS_FRAME_CACHE_SIZE', 1024 * 1024))
+
+
+def encode_frame(text, encoding):
+    """Wire frame of the JSON ``text`` for a socket's ``encoding``, msgpack and zlib frames cached."""
+    if encoding.endswith('+zlib') and len(text) < WS_COMPRESS_THRESHOLD:
+        encoding = encoding[:-len('+zlib')]
+
+    if encoding == 'json':
+        return text
+
+    key = text, encoding
+    frame = _frame_cache.get(key)
+    if frame is None:
+        frame = _encode_frame(text, encoding)
+        _frame_cache.set(key, frame)
+    return frame
+
+
+def _encode_frame(text, encoding):
+    if encoding == 'json+zlib':
+        return bytes([FRAME_ZLIB | FRAME_JSON]) + zlib.compress(text.encode())
+
+    packed = msgpack.packb(json.loads(text))
+    if encoding == 'msgpack':
+        return bytes([0]) + packed
+    return bytes([FRAME_ZLIB]) + zlib.compress(packed)
+
+
+def decode_payload(event):
+    return json.loads(event['text'])
+
+
+def message(payload, **extra):
+    """Channel layer message carrying ``payload`` as JSON text once, consumers derive their wire format."""
+    return dict(extra, type=payload['type'], text=json.dumps(payload))
+
+
+# ============================================================================= SUBSCRIPTIONS
+def model_group_name(model):
+    return 'model.{}'.format(model._meta.label_lower)
+
+
+def object_group_name(model, pk):
+    return '{}.{}'.format(model_group_name(model), pk)
+
+
+def _send_all(messages):
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not messages:
+        return
+
+    async def send_all():
+        await asyncio.gather(
+            *(channel_layer.group_send(group_name, data) for group_name, data in messages),
+            return_exceptions=True,
+        )
+
+    async_to_sync(send_all)()
+
+
+def _status_change(model, old_status, new_status, action, user):
+    return {
+        'type': 'status_change',
+        'model': model._meta.label_lower,
+        'old_status': old_status.name if old_status else None,
+        'new_status': new_status.name,
+        'action': action.name,
+        'actor': user.pk,
+        'allowed_actions': [action.name for action in model.state_machine.get_allowed_actions(new_status)],
+        'timestamp': timezone.now().timestamp(),
+    }
+
+
+def publish_transition(instance, old_status, new_status, action, user):
+    """Send a status change to the subscribers of the instance and of its model."""
+    model = instance.__class__
+    payload = _status_change(model, old_status, new_status, action, user)
+    payload['pk'] = instance.pk
+    data = message(payload)
+    _send_all([
+        (object_group_name(model, instance.pk), data),
+        (model_group_name(model), data),
+    ])
+
+
+def publish_bulk_transition(model, groups, action, user):
+    """Send one status change per moved status group, listing its pks, to the model subscribers."""
+    messages = []
+    for old_status, pks in groups.items():
+        payload = _status_change(model, old_status, model.state_machine.get_next_status(old_status, action), action, user)
+        payload['pks'] = pks
+        messages.append((model_group_name(model), message(payload)))
+
+    _send_all(messages)
@@ -0,0 +1,76 @@
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.export import ExportEncoder
+from core.management.utils import get_stateful_models
+
+
+class Command(BaseCommand):
+    help = 'Move action logs older than a cutoff into the archive table or gzipped NDJSON files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='app_label.ModelName, every stateful model by default.')
+        parser.add_argument('--days', type=int, required=True, help='Archive logs older than this many days.')
+        parser.add_argument('--output-dir', help='Write gzipped NDJSON files here instead of the archive table.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, models, days, output_dir, batch_size, **options):
+        if output_dir and not os.path.isdir(output_dir):
+            raise CommandError('{} is not a directory.'.format(output_dir))
+
+        cutoff = timezone.now() - timedelta(days=days)
+        for model in get_stateful_models(models):
+            archived_log_class = model._get_archived_log_class()
+            if not output_dir and archived_log_class is None:
+                self.stdout.write('{}: no archive table, skipped.'.format(model._meta.label))
+                continue
+
+            if output_dir:
+                path = os.path.join(output_dir, '{}.actions.{:%Y%m%d%H%M%S}.ndjson.gz'.format(
+                    model._meta.label_lower, cutoff,
+                ))
+                with gzip.open(path, 'at') as file:
+                    count = self.archive(model, cutoff, batch_size, lambda rows: self.write_rows(file, rows))
+            else:
+                count = self.archive(model, cutoff, batch_size, lambda rows: self.insert_rows(archived_log_class, rows))
+
+            self.stdout.write('{}: {} logs archived.'.format(model._meta.label, count))
+
+    @staticmethod
+    def archive(model, cutoff, batch_size, store):
+        """Move logs older than ``cutoff``, keeping the latest of each action of an object live when
+        LAST_DOER reads it from the log (no last doer table)."""
+        log_class = model._get_log_class()
+        old_logs = log_class.objects.filter(timestamp__lt=cutoff).order_by('id')
+        if model._get_last_doer_class() is None:
+            old_logs = old_logs.exclude(id__in=model._get_last_logs().values('id'))
+        field_names = [field.attname for field in log_class._meta.concrete_fields]
+        count = 0
+        while True:
+            with transaction.atomic():
+                rows = list(old_logs.values(*field_names)[:batch_size])
+                if not rows:
+                    return count
+
+                store(rows)
+                log_class.objects.filter(id__in=[row['id'] for row in rows]).delete()
+                count += len(rows)
+
+    @staticmethod
+    def insert_rows(archived_log_class, rows):
+        field_names = {field.attname for field in archived_log_class._meta.concrete_fields}
+        archived_log_class.objects.bulk_create(
+            archived_log_class(**{key: value for key, value in row.items() if key in field_names})
+            for row in rows
+        )
+
+    @staticmethod
+    def write_rows(file, rows):
+        file.writelines(json.dumps(row, cls=ExportEncoder) + '\n' for row in rows)
+        file.flush()
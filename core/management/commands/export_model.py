@@ -0,0 +1,49 @@
+import sys
+import time
+
+from django.apps import apps
+from django.core.management import BaseCommand, CommandError
+
+from core.export import FORMATS, iter_export
+from core.models import StatefulModel
+
+
+class Command(BaseCommand):
+    help = 'Stream the rows of a model, or the action logs of a stateful model, as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='app_label.ModelName')
+        parser.add_argument('--actions', action='store_true', help='Export the action logs of the stateful model.')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson', dest='export_format')
+        parser.add_argument('--output', help='File to write, stdout by default.')
+        parser.add_argument('--gzip', action='store_true', dest='compress')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per round trip.')
+
+    def handle(self, model, actions, export_format, output, compress, chunk_size, **options):
+        try:
+            model = apps.get_model(model)
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if actions:
+            if not issubclass(model, StatefulModel):
+                raise CommandError('{} is not a stateful model.'.format(model._meta.label))
+            model = model._get_log_class()
+
+        if compress and not output:
+            raise CommandError('--gzip needs --output.')
+
+        started = time.monotonic()
+        size = 0
+        chunks = iter_export(model._default_manager.all(), export_format, compress, chunk_size)
+        if output:
+            with (open(output, 'wb') if compress else open(output, 'w', newline='')) as file:
+                for chunk in chunks:
+                    size += file.write(chunk)
+        else:
+            for chunk in chunks:
+                size += sys.stdout.write(chunk)
+
+        self.stderr.write('{}: {} {} written in {:.2f}s.'.format(
+            model._meta.label, size, 'bytes' if compress else 'characters', time.monotonic() - started,
+        ))
@@ -0,0 +1,77 @@
+import gzip
+import time
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from core.export import FORMATS
+from core.importer import InvalidRow, StatefulImport, iter_file_rows
+from core.models import StatefulModel
+
+
+class Command(BaseCommand):
+    help = 'Load NDJSON or CSV exports (see export_model) into a stateful model and its action logs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='app_label.ModelName')
+        parser.add_argument('objects', help='File of the objects, gzipped if it ends with .gz.')
+        parser.add_argument('--actions', help='File of their action logs, in the order they were done.')
+        parser.add_argument('--format', choices=FORMATS, dest='import_format',
+                            help='Guessed from the file extension by default.')
+        parser.add_argument('--synthesize-actions', metavar='USERNAME',
+                            help='Log the shortest path to their status, done by this user, for objects without logs.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows validated and written at once.')
+
+    def handle(self, model, objects, actions, import_format, synthesize_actions, chunk_size, **options):
+        try:
+            model = apps.get_model(model)
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if not issubclass(model, StatefulModel):
+            raise CommandError('{} is not a stateful model.'.format(model._meta.label))
+
+        synthesize_user = None
+        if synthesize_actions:
+            user_model = get_user_model()
+            try:
+                synthesize_user = user_model.objects.get(**{user_model.USERNAME_FIELD: synthesize_actions})
+            except user_model.DoesNotExist:
+                raise CommandError('{} is not a user.'.format(synthesize_actions))
+
+        started = time.monotonic()
+        files = [self.open(objects)] + ([self.open(actions)] if actions else [])
+        try:
+            rows = [iter_file_rows(file, import_format or self.guess_format(file.name)) for file in files]
+            counts = StatefulImport(model, chunk_size, synthesize_user, progress=self.progress).run(*rows)
+        except (InvalidRow, IntegrityError) as e:
+            raise CommandError(str(e))
+        finally:
+            for file in files:
+                file.close()
+
+        elapsed = time.monotonic() - started
+        for label, count in counts.items():
+            self.stdout.write('{}: {} rows imported.'.format(label, count))
+        self.stdout.write('{} rows in {:.2f}s, {:.0f} rows/s.'.format(
+            sum(counts.values()), elapsed, sum(counts.values()) / elapsed if elapsed else 0,
+        ))
+
+    @staticmethod
+    def open(path):
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', newline='')
+        return open(path, newline='')
+
+    @staticmethod
+    def guess_format(path):
+        extension = path[:-3] if path.endswith('.gz') else path
+        for export_format in FORMATS:
+            if extension.endswith('.' + export_format):
+                return export_format
+        raise CommandError('Cannot guess the format of {}, use --format.'.format(path))
+
+    def progress(self, label, count, elapsed):
+        self.stderr.write('{}: {} rows, {:.0f} rows/s'.format(label, count, count / elapsed if elapsed else 0))
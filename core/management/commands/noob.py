@@ -1,6 +1,85 @@
-from django.core.management import BaseCommand
+import random
+import time
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
 
 
 class Command(BaseCommand):
-    def handle(self, **options):
-        pass
\ No newline at end of file
+    help = 'Seed the synthetic data of the benchmark suite (benchmarks app), replacing the previous one.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--tickets', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=2, help='Comments per ticket.')
+        parser.add_argument('--batch-size', type=int, help='Rows per INSERT, the database maximum by default.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, users, tickets, comments, batch_size, seed, **options):
+        if not apps.is_installed('benchmarks'):
+            raise CommandError('benchmarks app is not installed, run with --settings=benchmarks.settings.')
+
+        from benchmarks.models import LABEL, PRIORITY, Comment, Ticket, TicketLastDoer, TicketLog
+
+        started = time.monotonic()
+        rng = random.Random(seed)
+        paths = Ticket.state_machine.get_paths()
+        statuses = list(Ticket.STATUS)
+        priorities = list(PRIORITY)
+        labels = list(LABEL)
+        now = timezone.now()
+
+        with transaction.atomic():
+            Ticket.objects.all().delete()
+            User.objects.filter(username__startswith='bench_').delete()
+            user_list = User.objects.bulk_create(
+                (User(username='bench_{}'.format(i), password='!') for i in range(users)),
+                batch_size=batch_size,
+            )
+            if not user_list[0].pk:
+                user_list = list(User.objects.filter(username__startswith='bench_').order_by('id'))
+
+            ticket_list = Ticket.objects.bulk_create(
+                (Ticket(
+                    title='Ticket {}'.format(i),
+                    status=statuses[i % len(statuses)],
+                    priority=rng.choice(priorities),
+                    labels=rng.sample(labels, rng.randint(0, 3)),
+                    reporter=rng.choice(user_list),
+                    assignee=rng.choice(user_list),
+                    updated=now,
+                ) for i in range(tickets)),
+                batch_size=batch_size,
+            )
+            if not ticket_list[0].pk:
+                ticket_list = list(Ticket.objects.order_by('id'))
+
+            logs = []
+            last_doers = {}
+            for ticket in ticket_list:
+                for status, action in paths[ticket.status]:
+                    user_id = ticket.reporter_id if action == Ticket.ACTION.CREATE else ticket.assignee_id
+                    logs.append(TicketLog(stater=ticket, status=status, user_id=user_id, action=action))
+                    last_doers[ticket.pk, action] = TicketLastDoer(
+                        stater=ticket, action=action, user_id=user_id, timestamp=now,
+                    )
+            TicketLog.objects.bulk_create(logs, batch_size=batch_size)
+            TicketLastDoer.objects.bulk_create(last_doers.values(), batch_size=batch_size)
+
+            Comment.objects.bulk_create(
+                (Comment(
+                    ticket=ticket,
+                    body='Comment {} on ticket {}'.format(i, ticket.pk),
+                    priority=ticket.priority,
+                    created_by_id=ticket.reporter_id,
+                    updated_by_id=ticket.assignee_id,
+                ) for ticket in ticket_list for i in range(comments)),
+                batch_size=batch_size,
+            )
+
+        self.stdout.write('{} users, {} tickets, {} logs, {} comments seeded in {:.2f}s.'.format(
+            users, tickets, len(logs), tickets * comments, time.monotonic() - started,
+        ))
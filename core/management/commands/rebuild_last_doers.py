@@ -0,0 +1,38 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from core.management.utils import get_stateful_models
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the last doer index of stateful models from their action logs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='app_label.ModelName, every indexed stateful model by default.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, models, batch_size, **options):
+        for model in get_stateful_models(models):
+            last_doer_class = model._get_last_doer_class()
+            if last_doer_class is None:
+                continue
+
+            count = 0
+            with transaction.atomic():
+                last_doer_class.objects.all().delete()
+                records = []
+                logs = model._get_last_logs().values_list('stater_id', 'action', 'user_id', 'timestamp')
+                for stater_id, action, user_id, timestamp in logs.iterator(chunk_size=batch_size):
+                    records.append(last_doer_class(
+                        stater_id=stater_id,
+                        action=action,
+                        user_id=user_id,
+                        timestamp=timestamp,
+                    ))
+                    if len(records) >= batch_size:
+                        count += len(last_doer_class.objects.bulk_create(records))
+                        records = []
+
+                count += len(last_doer_class.objects.bulk_create(records))
+
+            self.stdout.write('{}: {} last doers rebuilt.'.format(model._meta.label, count))
@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from core.management.utils import get_stateful_models
+
+
+class Command(BaseCommand):
+    help = 'Add the action logs written since the last run to the state stat tables of stateful models.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='app_label.ModelName, every stateful model with stats by default.')
+        parser.add_argument('--settle', type=int, default=60, help='Seconds a log waits before being counted.')
+
+    def handle(self, models, settle, **options):
+        for model in get_stateful_models(models):
+            if model._get_state_stat_class() is None:
+                continue
+
+            count = model.refresh_state_stats(settle=settle)
+            self.stdout.write('{}: {} logs added.'.format(model._meta.label, count))
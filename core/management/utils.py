@@ -0,0 +1,24 @@
+from django.apps import apps
+from django.core.management import CommandError
+
+from core.models import StatefulModel
+
+
+def get_stateful_models(labels):
+    """Resolve ``app_label.ModelName`` labels, or every concrete stateful model when empty."""
+    if not labels:
+        return [model for model in apps.get_models() if issubclass(model, StatefulModel)]
+
+    models = []
+    for label in labels:
+        try:
+            model = apps.get_model(label)
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if not issubclass(model, StatefulModel):
+            raise CommandError('{} is not a stateful model.'.format(label))
+
+        models.append(model)
+
+    return models
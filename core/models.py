@@ -1,22 +1,45 @@
+import asyncio
+from datetime import timedelta
 from enum import Enum
-from types import DynamicClassAttribute
+from functools import lru_cache, partial
+from itertools import count
+from types import DynamicClassAttribute, MappingProxyType
 from typing import Type
 from uuid import uuid4
 
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
 from django import forms
+from django.apps import apps
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models, transaction
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields.array import ArrayContains, ArrayOverlap
+from django.core import checks
+from django.core.exceptions import FieldDoesNotExist
+from django.db import migrations, models, transaction
+from django.db.models import prefetch_related_objects
+from django.db.models.functions import Cast, TruncDate
+from django.db.models.base import ModelBase
 from django.forms import SelectMultiple, MultipleChoiceField
 from django.utils import timezone
 from django.utils.decorators import classproperty
 from rest_framework.fields import get_attribute
 
+from core import live
+
 
 class LabeledEnum(str, Enum):
-    def __new__(cls, value):
+    """Enum of labeled names, ``MEMBER = 'Label'`` or ``MEMBER = ('Label', code)``.
+
+    The optional integer code is the stable value stored by fields with ``storage='smallint'``.
+    """
+
+    def __new__(cls, value, code=None):
         ignoring_value = str(uuid4())
         obj = super().__new__(cls, ignoring_value)
         obj.label = value
+        obj.code = code
         obj._value_ = ignoring_value
         return obj
 
@@ -27,6 +50,10 @@ class LabeledEnum(str, Enum):
     def get(cls, name):
         return cls.__members__.get(name)
 
+    @classmethod
+    def from_code(cls, code):
+        return _get_decoders(cls)[1].get(code)
+
     @property
     def text(self):
         return self.label or self.name
@@ -53,20 +80,57 @@ class _EnumFormField(forms.TypedChoiceField):
             return value
 
 
+def async_atomic(function):
+    """Awaitable form of ``function`` running inside transaction.atomic() in one database thread hop."""
+    @database_sync_to_async
+    def inner(*args, **kwargs):
+        with transaction.atomic():
+            return function(*args, **kwargs)
+
+    return inner
+
+
 class _MultiEnumWidget(SelectMultiple):
     def format_value(self, value):
         return [str(getattr(v, 'value', v)) for v in value] if value else []
 
 
+@lru_cache(maxsize=None)
+def _get_decoders(enum):
+    """(value -> member, code -> member) dicts, values being member names, uuids and members."""
+    by_value = {}
+    for member in enum:
+        by_value[member.value] = by_value[member._value_] = member
+    return by_value, {member.code: member for member in enum if member.code is not None}
+
+
 # ============================================================================= FIELDS
 class EnumField(models.CharField):
-    def __init__(self, enum: Type[LabeledEnum], **kwargs):
+    """Enum member stored by name, or by its code with ``storage='smallint'``."""
+
+    STORAGES = ('varchar', 'smallint')
+
+    def __init__(self, enum: Type[LabeledEnum], storage='varchar', **kwargs):
         assert issubclass(enum, LabeledEnum)
+        assert storage in self.STORAGES
         self.enum = enum
+        self.storage = storage
         kwargs['choices'] = [(e.value, e.name) for e in enum]
         kwargs['max_length'] = 100
         super().__init__(**kwargs)
 
+    def check(self, **kwargs):
+        errors = super().check(**kwargs)
+        if self.storage == 'smallint':
+            codes = [e.code for e in self.enum]
+            if None in codes or len(set(codes)) != len(codes):
+                errors.append(checks.Error(
+                    'smallint storage needs a unique code on every member of {}.'.format(self.enum.__name__),
+                    obj=self,
+                    id='core.E002',
+                ))
+        return errors
+
     def deconstruct(self):
         name, path, args, kwargs = super().deconstruct()
         if 'choices' in kwargs:
@@ -75,21 +139,38 @@ class EnumField(models.CharField):
         if 'default' in kwargs:
             if isinstance(kwargs['default'], LabeledEnum):
                 kwargs['default'] = kwargs['default'].value
+        if self.storage != 'varchar':
+            kwargs['storage'] = self.storage
         return name, path, args, kwargs
 
+    def get_internal_type(self):
+        return 'SmallIntegerField' if self.storage == 'smallint' else super().get_internal_type()
+
     def from_db_value(self, value, expression, connection):
-        return self.to_python(value)
+        if value is None:
+            return value
+
+        by_value, by_code = _get_decoders(self.enum)
+        member = by_code.get(value) if self.storage == 'smallint' else by_value.get(value)
+        return value if member is None else member
 
     def to_python(self, value):
-        try:
-            return self.enum(value)
-        except:
-            return super().to_python(value)
+        by_value, by_code = _get_decoders(self.enum)
+        if isinstance(value, str):
+            return by_value.get(value) or super().to_python(value)
+
+        if isinstance(value, int) and self.storage == 'smallint':
+            return by_code.get(value, value)
+
+        return super().to_python(value)
 
     def get_db_prep_value(self, value, connection, prepared=False):
         value = super().get_db_prep_value(value, connection, prepared)
         if isinstance(value, LabeledEnum):
-            return value.value
+            return value.code if self.storage == 'smallint' else value.value
+        if value == '' and self.storage == 'smallint':
+            # the empty initial status of logs
+            return None
         return value
 
     def _get_flatchoices(self):
@@ -113,9 +194,7 @@ class EnumField(models.CharField):
         return super().formfield(**default)
 
 
-class MultiEnumField(models.TextField):
-    description = "String (up to %(max_length)s)"
-
+class _MultiEnumMixin:
     def __init__(self, enum: Type[LabeledEnum], **kwargs):
         assert issubclass(enum, LabeledEnum)
         self.enum = enum
@@ -126,38 +205,335 @@ class MultiEnumField(models.TextField):
         args = [_DummyLabeledEnum]
         return name, path, args, kwargs
 
+    def _to_member(self, value):
+        return _get_decoders(self.enum)[0].get(value if isinstance(value, str) else str(value))
+
+    def _to_names(self, value):
+        return [getattr(v, 'name', v) for v in value]
+
+    def formfield(self, **kwargs):
+        return MultipleChoiceField(
+            choices=[(e.value, e.name) for e in self.enum],
+            required=not self.blank,
+            widget=_MultiEnumWidget,
+        )
+
+
+class MultiEnumField(_MultiEnumMixin, models.TextField):
+    description = "String (up to %(max_length)s)"
+
     def from_db_value(self, value, expression, connection):
-        return self.to_python(value)
+        if not value:
+            return ''
+
+        by_value = _get_decoders(self.enum)[0]
+        return [by_value.get(name) for name in value.split(',')]
 
     def to_python(self, value):
         if not value:
             return ''
 
         if type(value) is list:
-            return [self.enum(str(value)) for value in value]
+            return [self._to_member(value) for value in value]
 
         if type(value) is str:
-            return [self.enum(str(value)) for value in value.split(',')]
+            return [self._to_member(value) for value in value.split(',')]
 
         raise Exception('invalid enum list')
 
     def get_prep_value(self, value):
-        return ','.join(str(v.value) for v in value)
-
-    def formfield(self, **kwargs):
-        return MultipleChoiceField(
-            choices=[(e.value, e.name) for e in self.enum],
-            required=not self.blank,
-            widget=_MultiEnumWidget,
-        )
+        return ','.join(self._to_names(value))
 
     def value_to_string(self, obj):
         return self.get_prep_value(self.value_from_object(obj))
 
 
+class MultiEnumArrayField(_MultiEnumMixin, ArrayField):
+    """MultiEnumField stored as a PostgreSQL array of member names.
+
+    Filter with ``__has``, ``__has_any`` and ``__has_all``, which a GinIndex on the field serves.
+    """
+
+    def __init__(self, enum: Type[LabeledEnum], **kwargs):
+        kwargs['base_field'] = models.CharField(max_length=100)
+        super().__init__(enum, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop('base_field')
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if value is None:
+            return value
+
+        if type(value) is str:
+            value = value.split(',') if value else []
+
+        return [self._to_member(v) for v in value]
+
+    def get_prep_value(self, value):
+        return self._to_names(value) if value is not None else value
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        return super().get_db_prep_value(self.get_prep_value(value), connection, prepared)
+
+    def value_to_string(self, obj):
+        return ','.join(self._to_names(self.value_from_object(obj) or []))
+
+
+class MultiEnumBitmaskField(_MultiEnumMixin, models.BigIntegerField):
+    """MultiEnumField stored as an integer bitmask, bit n for the n-th member of the enum.
+
+    Members may only be appended to the enum, reordering them changes stored values. Filter with
+    ``__has``, ``__has_any`` and ``__has_all``.
+    """
+
+    def get_mask(self, value):
+        if isinstance(value, int):
+            return value
+
+        if isinstance(value, (str, LabeledEnum)):
+            value = [value]
+
+        members = list(self.enum)
+        mask = 0
+        for v in value:
+            member = self._to_member(v)
+            if member is None:
+                raise ValueError('"{}" is not a valid {}.'.format(v, self.enum.__name__))
+            mask |= 1 << members.index(member)
+        return mask
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, list):
+            return value
+
+        if type(value) is str:
+            return [self._to_member(v) for v in value.split(',')] if value else []
+
+        return [member for i, member in enumerate(self.enum) if value & (1 << i)]
+
+    def get_prep_value(self, value):
+        return self.get_mask(value) if value is not None else value
+
+    def value_to_string(self, obj):
+        return ','.join(self._to_names(self.value_from_object(obj) or []))
+
+
+_ENUM_FIELDS = (EnumField, _MultiEnumMixin)
+
+
+class _MultiEnumLookupMixin:
+    def get_prep_lookup(self):
+        if isinstance(self.rhs, (str, LabeledEnum)):
+            self.rhs = [self.rhs]
+        return super().get_prep_lookup()
+
+
+@MultiEnumArrayField.register_lookup
+class _ArrayHas(_MultiEnumLookupMixin, ArrayContains):
+    lookup_name = 'has'
+
+
+@MultiEnumArrayField.register_lookup
+class _ArrayHasAll(_MultiEnumLookupMixin, ArrayContains):
+    lookup_name = 'has_all'
+
+
+@MultiEnumArrayField.register_lookup
+class _ArrayHasAny(_MultiEnumLookupMixin, ArrayOverlap):
+    lookup_name = 'has_any'
+
+
+class _BitmaskLookup(models.Lookup):
+    template = None
+
+    def get_prep_lookup(self):
+        return self.lhs.output_field.get_mask(self.rhs)
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return self.template.format(lhs=lhs, rhs=rhs), lhs_params + rhs_params * self.template.count('{rhs}')
+
+
+@MultiEnumBitmaskField.register_lookup
+class _BitmaskHas(_BitmaskLookup):
+    lookup_name = 'has'
+    template = '({lhs} & {rhs}) = {rhs}'
+
+
+@MultiEnumBitmaskField.register_lookup
+class _BitmaskHasAll(_BitmaskLookup):
+    lookup_name = 'has_all'
+    template = '({lhs} & {rhs}) = {rhs}'
+
+
+@MultiEnumBitmaskField.register_lookup
+class _BitmaskHasAny(_BitmaskLookup):
+    lookup_name = 'has_any'
+    template = '({lhs} & {rhs}) <> 0'
+
+
+def copy_multi_enum_field(model_label, from_field, to_field, enum=None, batch_size=1000):
+    """Migration operation copying a text MultiEnumField into an array or bitmask one next to it.
+
+    Add the new field, run this operation, then remove the old field (and rename the new one).
+    Historical models do not keep the enum, pass it for a bitmask target.
+    """
+    def forwards(apps, schema_editor):
+        model = apps.get_model(model_label)
+        target = model._meta.get_field(to_field)
+        if isinstance(target, MultiEnumBitmaskField):
+            assert enum is not None, 'enum is required to copy into a bitmask.'
+            to_value = MultiEnumBitmaskField(enum).get_mask
+        else:
+            to_value = list
+
+        quote = schema_editor.quote_name
+        if isinstance(target, ArrayField) and schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute("UPDATE {table} SET {to} = string_to_array(NULLIF({source}, ''), ',')".format(
+                table=quote(model._meta.db_table), to=quote(to_field), source=quote(from_field),
+            ))
+            return
+
+        rows = model._default_manager.annotate(
+            _raw=Cast(from_field, models.TextField()),
+        ).values_list('pk', '_raw').order_by('pk')
+        changes = []
+        for pk, raw in rows.iterator(chunk_size=batch_size):
+            changes.append(model(pk=pk, **{to_field: to_value(raw.split(',') if raw else [])}))
+            if len(changes) >= batch_size:
+                model._default_manager.bulk_update(changes, [to_field])
+                changes = []
+
+        model._default_manager.bulk_update(changes, [to_field])
+
+    return migrations.RunPython(forwards, migrations.RunPython.noop)
+
+
+class AlterEnumStorage(migrations.AlterField):
+    """AlterField for an EnumField or status column switching between varchar and smallint storage.
+
+    Replace the generated AlterField with it, the stored names are rewritten to the codes of
+    ``enum`` (or back) around the column type change. Historical models do not keep the enum.
+    """
+
+    def __init__(self, model_name, name, field, enum, preserve_default=True):
+        self.enum = enum
+        super().__init__(model_name, name, field, preserve_default)
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        kwargs['enum'] = self.enum
+        return name, args, kwargs
+
+    def _rewrite(self, schema_editor, model, to_codes):
+        pairs = [(e.name, str(e.code)) for e in self.enum]
+        if to_codes:
+            # the empty initial status of logs has no code
+            pairs.append(('', None))
+        else:
+            pairs = [(code, name) for name, code in pairs]
+        column = schema_editor.quote_name(model._meta.get_field(self.name).column)
+        schema_editor.execute('UPDATE {table} SET {column} = CASE {column} {cases} ELSE {column} END'.format(
+            table=schema_editor.quote_name(model._meta.db_table),
+            column=column,
+            cases=' '.join(['WHEN %s THEN %s'] * len(pairs)),
+        ), [value for pair in pairs for value in pair])
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        # AlterField.database_backwards runs this with the states swapped
+        from_model = from_state.apps.get_model(app_label, self.model_name)
+        to_model = to_state.apps.get_model(app_label, self.model_name)
+        from_storage = getattr(from_model._meta.get_field(self.name), 'storage', 'varchar')
+        to_storage = getattr(to_model._meta.get_field(self.name), 'storage', 'varchar')
+        if from_storage != 'smallint' and to_storage == 'smallint':
+            self._rewrite(schema_editor, from_model, to_codes=True)
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+        if from_storage == 'smallint' and to_storage != 'smallint':
+            self._rewrite(schema_editor, to_model, to_codes=False)
+
+
 # ============================================================================= MODELS
+class _RawEnumQuery(models.sql.Query):
+    """Query whose results skip the from_db_value of enum fields."""
+
+    def get_compiler(self, using=None, connection=None):
+        compiler = super().get_compiler(using, connection)
+        get_converters = compiler.get_converters
+
+        def get_raw_enum_converters(expressions):
+            converters = {}
+            for i, (functions, expression) in get_converters(expressions).items():
+                functions = [f for f in functions if not isinstance(getattr(f, '__self__', None), _ENUM_FIELDS)]
+                if functions:
+                    converters[i] = (functions, expression)
+            return converters
+
+        compiler.get_converters = get_raw_enum_converters
+        return compiler
+
+
 class CommonModelQuerySet(models.QuerySet):
-    pass
+    def raw_enums(self):
+        """Return enum fields as stored (names, codes, masks) instead of members, e.g. for exports."""
+        clone = self._chain()
+        clone.query = clone.query.chain(_RawEnumQuery)
+        return clone
+
+    def bulk_create_with_hooks(self, objs, user=None, batch_size=1000, **kwargs):
+        """bulk_create() calling pre_save_batch/post_save_batch of the model around each batch.
+
+        ``user`` stamps created_by and updated_by of TransactionalModel instances.
+        """
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            for batch in self._hook_batches(objs, batch_size):
+                if user is not None and issubclass(self.model, TransactionalModel):
+                    for obj in batch:
+                        obj.created_by = obj.updated_by = user
+
+                self.model.pre_save_batch(batch)
+                self.bulk_create(batch, **kwargs)
+                self.model.post_save_batch(batch)
+
+        return objs
+
+    def bulk_update_with_hooks(self, objs, fields, user=None, batch_size=1000):
+        """bulk_update() calling pre_save_batch/post_save_batch of the model around each batch.
+
+        ``user`` stamps updated_by (and updated_time) of TransactionalModel instances.
+        """
+        objs = list(objs)
+        fields = list(fields)
+        if user is not None and issubclass(self.model, TransactionalModel):
+            fields += [field for field in ('updated_by', 'updated_time') if field not in fields]
+
+        with transaction.atomic(using=self.db):
+            for batch in self._hook_batches(objs, batch_size):
+                if user is not None and issubclass(self.model, TransactionalModel):
+                    now = timezone.now()
+                    for obj in batch:
+                        obj.updated_by = user
+                        obj.updated_time = now
+
+                self.model.pre_save_batch(batch)
+                self.bulk_update(batch, fields)
+                self.model.post_save_batch(batch)
+
+    @staticmethod
+    def _hook_batches(objs, batch_size):
+        batch_size = batch_size or len(objs) or 1
+        for start in range(0, len(objs), batch_size):
+            yield objs[start:start + batch_size]
 
 
 class CommonModel(models.Model):
@@ -175,11 +551,38 @@ class CommonModel(models.Model):
     def post_save(self):
         pass
 
+    @classmethod
+    def pre_save_batch(cls, instances):
+        """Called before each batch of the bulk *_with_hooks methods, pre_save() of every instance by default."""
+        for instance in instances:
+            instance.pre_save()
+
+    @classmethod
+    def post_save_batch(cls, instances):
+        """Called after each batch of the bulk *_with_hooks methods, post_save() of every instance by default."""
+        for instance in instances:
+            instance.post_save()
+
     class Meta:
         abstract = True
 
 
+class TransactionalModelQuerySet(CommonModelQuerySet):
+    def with_audit_users(self, *fields):
+        """Join created_by and updated_by, loading only their pk and ``fields`` (username by default)."""
+        fields = set(fields or ['username'])
+        deferred = [field.name for field in User._meta.concrete_fields
+                    if not field.primary_key and field.name not in fields]
+        return self.select_related('created_by', 'updated_by').defer(*[
+            '{}__{}'.format(relation, name)
+            for relation in ('created_by', 'updated_by')
+            for name in deferred
+        ])
+
+
 class TransactionalModel(CommonModel):
+    objects = TransactionalModelQuerySet.as_manager()
+
     created_time = models.DateTimeField(auto_now_add=True, editable=False)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='+', editable=False)
     updated_time = models.DateTimeField(auto_now=True, editable=False)
@@ -192,9 +595,15 @@ class TransactionalModel(CommonModel):
 # ============================================================================= STATEFUL MODELS
 
 class _StatusField(EnumField):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, storage=None, **kwargs):
+        self.storage = storage
         super(EnumField, self).__init__(choices=[('', '')], max_length=100, editable=False)
 
+    def contribute_to_class(self, cls, name, **kwargs):
+        if self.storage is None and not cls._meta.abstract:
+            self.storage = getattr(cls, 'STATUS_STORAGE', 'varchar')
+        super().contribute_to_class(cls, name, **kwargs)
+
     @property
     def enum(self):
         try:
@@ -203,16 +612,27 @@ class _StatusField(EnumField):
             return _DummyLabeledEnum
 
 
+def _is_user_id(user_id, user):
+    return user_id is not None and user_id == user.pk
+
+
 class _ActionPermission:
     def permit(self, instance, user) -> bool:
         raise NotImplementedError()
 
+    def permit_many(self, instances, user) -> list:
+        """Same as permit() for a page of instances, one result per instance in order."""
+        return [self.permit(instance, user) for instance in instances]
+
     def __and__(self, other):
         return _AND(self, other)
 
     def __or__(self, other):
         return _OR(self, other)
 
+    def iter_permissions(self):
+        yield self
+
 
 class _AND(_ActionPermission):
     def __init__(self, *permissions):
@@ -221,6 +641,23 @@ class _AND(_ActionPermission):
     def permit(self, instance, user):
         return all(permission.permit(instance, user) for permission in self.permissions)
 
+    def permit_many(self, instances, user):
+        results = [True] * len(instances)
+        for permission in self.permissions:
+            indexes = [i for i, result in enumerate(results) if result]
+            if not indexes:
+                break
+
+            permitted = permission.permit_many([instances[i] for i in indexes], user)
+            for i, result in zip(indexes, permitted):
+                results[i] = result
+
+        return results
+
+    def iter_permissions(self):
+        for permission in self.permissions:
+            yield from permission.iter_permissions()
+
 
 class _OR(_ActionPermission):
     def __init__(self, *permissions):
@@ -229,19 +666,78 @@ class _OR(_ActionPermission):
     def permit(self, instance, user):
         return any(permission.permit(instance, user) for permission in self.permissions)
 
+    def permit_many(self, instances, user):
+        results = [False] * len(instances)
+        for permission in self.permissions:
+            indexes = [i for i, result in enumerate(results) if not result]
+            if not indexes:
+                break
+
+            permitted = permission.permit_many([instances[i] for i in indexes], user)
+            for i, result in zip(indexes, permitted):
+                results[i] = result
+
+        return results
+
+    def iter_permissions(self):
+        for permission in self.permissions:
+            yield from permission.iter_permissions()
+
 
 class ACTION_PERMISSION:
     class EVERYONE(_ActionPermission):
         def permit(self, instance, user):
             return True
 
+        def permit_many(self, instances, user):
+            return [True] * len(instances)
+
     class LAST_DOER(_ActionPermission):
         def __init__(self, action):
             self.action = action
 
         def permit(self, instance, user):
-            log = instance.actions.filter(action=self.action).last()
-            return bool(log) and log.user == user
+            return self.permit_many([instance], user)[0]
+
+        def permit_many(self, instances, user):
+            missing = [instance for instance in instances if self.action not in getattr(instance, '_last_doers', {})]
+            if missing:
+                self.prefetch(missing, [self.action])
+
+            return [_is_user_id(instance._last_doers[self.action], user) for instance in instances]
+
+        @staticmethod
+        def prefetch(instances, actions):
+            """Load the last doer of each action for all instances in one grouped query.
+
+            Results are cached on the instances as ``_last_doers`` (action -> user id, None when the
+            action was never done), actions already cached on an instance are kept.
+            """
+            if not instances or not actions:
+                return
+
+            by_pk = {}
+            for instance in instances:
+                if not hasattr(instance, '_last_doers'):
+                    instance._last_doers = {}
+                for action in actions:
+                    if action not in instance._last_doers:
+                        instance._last_doers[action] = None
+                        by_pk[instance.pk] = instance
+
+            if not by_pk:
+                return
+
+            model = instances[0].__class__
+            filters = dict(stater_id__in=list(by_pk), action__in=list(actions))
+            last_doer_class = model._get_last_doer_class()
+            if last_doer_class is not None:
+                records = last_doer_class.objects.filter(**filters)
+            else:
+                records = model._get_last_logs(**filters)
+
+            for stater_id, action, user_id in records.values_list('stater_id', 'action', 'user_id'):
+                by_pk[stater_id]._last_doers[action] = user_id
 
     class ATTRIBUTE(_ActionPermission):
         def __init__(self, name):
@@ -251,6 +747,29 @@ class ACTION_PERMISSION:
             expected_user = get_attribute(instance, self.name.split('.'))
             return user == expected_user
 
+        def permit_many(self, instances, user):
+            *path, name = self.name.split('.')
+            if path:
+                prefetch_related_objects(instances, '__'.join(path))
+
+            results = []
+            for instance in instances:
+                owner = get_attribute(instance, path)
+                field = self._get_field(owner, name)
+                if field is not None and field.many_to_one:
+                    results.append(_is_user_id(getattr(owner, field.attname), user))
+                else:
+                    results.append(user == get_attribute(owner, [name]))
+
+            return results
+
+        @staticmethod
+        def _get_field(owner, name):
+            try:
+                return owner._meta.get_field(name) if isinstance(owner, models.Model) else None
+            except FieldDoesNotExist:
+                return None
+
     class FUNCTION(_ActionPermission):
         def __init__(self, function):
             self.function = function
@@ -259,7 +778,186 @@ class ACTION_PERMISSION:
             return self.function(instance, user)
 
 
-class StatefulModel(CommonModel):
+class StateMachine:
+    """Frozen lookup tables compiled once from a StatefulModel's TRANSITION."""
+
+    HOOK_PREFIXES = ('pre', 'post', 'pre_bulk', 'post_bulk')
+
+    def __init__(self, model):
+        transition_map = {}
+        allowed_action_map = {}
+        reverse_map = {}
+        self.duplicate_edges = []
+        for current_status, action, next_status in model.TRANSITION:
+            if (current_status, action) in transition_map:
+                self.duplicate_edges.append((current_status, action, next_status))
+                continue
+
+            transition_map[(current_status, action)] = next_status
+            allowed_action_map.setdefault(current_status, []).append(action)
+            reverse_map.setdefault(next_status, []).append(action)
+
+        self.statuses = tuple(model.STATUS)
+        self.transition_map = MappingProxyType(transition_map)
+        self.allowed_action_map = MappingProxyType({k: tuple(v) for k, v in allowed_action_map.items()})
+        self.reverse_map = MappingProxyType({k: tuple(v) for k, v in reverse_map.items()})
+
+        actions = {action for _, action in transition_map}
+        self.hooks = MappingProxyType({
+            prefix: MappingProxyType({
+                action: hook
+                for action, hook in (
+                    (action, getattr(model, '{}_{}'.format(prefix, action.name.lower()), None))
+                    for action in actions
+                )
+                if callable(hook)
+            })
+            for prefix in self.HOOK_PREFIXES
+        })
+        self.coroutine_hooks = frozenset(
+            hook
+            for hooks in self.hooks.values()
+            for hook in hooks.values()
+            if asyncio.iscoroutinefunction(hook)
+        )
+
+    @staticmethod
+    def _status_key(status):
+        return status or None
+
+    def get_next_status(self, status, action):
+        return self.transition_map.get((self._status_key(status), action))
+
+    def get_allowed_actions(self, status):
+        return self.allowed_action_map.get(self._status_key(status), ())
+
+    def get_reaching_actions(self, status):
+        return self.reverse_map.get(status, ())
+
+    def get_hook(self, prefix, action):
+        return self.hooks[prefix].get(action)
+
+    def is_coroutine_hook(self, hook):
+        return hook in self.coroutine_hooks
+
+    def call_hook(self, prefix, action, *args):
+        """Call a hook from synchronous code, coroutine hooks are run to completion."""
+        hook = self.get_hook(prefix, action)
+        if hook is None:
+            return None
+
+        if self.is_coroutine_hook(hook):
+            return async_to_sync(hook)(*args)
+
+        return hook(*args)
+
+    def get_reachable_statuses(self):
+        reachable = set()
+        pending = [None]
+        while pending:
+            status = pending.pop()
+            for action in self.allowed_action_map.get(status, ()):
+                next_status = self.transition_map[(status, action)]
+                if next_status not in reachable:
+                    reachable.add(next_status)
+                    pending.append(next_status)
+
+        return reachable
+
+    def get_paths(self):
+        """Shortest [(status, action)] path from the initial state to every reachable status."""
+        paths = {None: []}
+        queue = [None]
+        while queue:
+            status = queue.pop(0)
+            for action in self.get_allowed_actions(status):
+                next_status = self.get_next_status(status, action)
+                if next_status not in paths:
+                    paths[next_status] = paths[status] + [(status, action)]
+                    queue.append(next_status)
+        return paths
+
+    def get_dead_end_statuses(self):
+        """Statuses that can never reach a final status (one without outgoing actions)."""
+        final = {status for status in self.statuses if status not in self.allowed_action_map}
+        if not final:
+            return set()
+
+        alive = set(final)
+        changed = True
+        while changed:
+            changed = False
+            for (status, action), next_status in self.transition_map.items():
+                if status is not None and status not in alive and next_status in alive:
+                    alive.add(status)
+                    changed = True
+
+        return {status for status in self.allowed_action_map if status is not None and status not in alive}
+
+    def check(self, model):
+        errors = []
+        for current_status, action, next_status in self.duplicate_edges:
+            errors.append(checks.Error(
+                'TRANSITION declares action {} from {} more than once.'.format(action.name, current_status),
+                obj=model,
+                id='core.E001',
+            ))
+
+        unreachable = [status for status in self.statuses if status not in self.get_reachable_statuses()]
+        if unreachable:
+            errors.append(checks.Warning(
+                'Statuses unreachable from the initial state: {}.'.format(', '.join(map(str, unreachable))),
+                obj=model,
+                id='core.W001',
+            ))
+
+        dead_ends = [status for status in self.statuses if status in self.get_dead_end_statuses()]
+        if dead_ends:
+            errors.append(checks.Warning(
+                'Statuses that can never reach a final status: {}.'.format(', '.join(map(str, dead_ends))),
+                obj=model,
+                id='core.W002',
+            ))
+
+        return errors
+
+
+class ConcurrentTransition(Exception):
+    """The row changed between reading its status and a compare-and-swap transition."""
+
+
+class StatefulModelBase(ModelBase):
+    def __new__(mcs, name, bases, attrs, **kwargs):
+        cls = super().__new__(mcs, name, bases, attrs, **kwargs)
+        cls.state_machine = StateMachine(cls)
+        return cls
+
+
+class StatefulModelQuerySet(CommonModelQuerySet):
+    def bulk_transition(self, user, action, **options):
+        return self.model.bulk_transition(self, user, action, **options)
+
+    def bulk_create_with_hooks(self, objs, user=None, batch_size=1000, **kwargs):
+        """Refused, stateful objects enter their status through transitions and are logged."""
+        raise Exception('stateful objects are created by transition() or the import_model command.')
+
+    def bulk_update_with_hooks(self, objs, fields, user=None, batch_size=1000):
+        """Same as CommonModelQuerySet's, stamping ``updated``. ``status`` only changes through transitions."""
+        fields = list(fields)
+        if 'status' in fields:
+            raise Exception('status is changed by transition() or bulk_transition().')
+
+        objs = list(objs)
+        now = timezone.now()
+        for obj in objs:
+            obj.updated = now
+        if 'updated' not in fields:
+            fields.append('updated')
+
+        super().bulk_update_with_hooks(objs, fields, user, batch_size)
+
+
+class StatefulModel(CommonModel, metaclass=StatefulModelBase):
     class STATUS(LabeledEnum):
         DUMMY = ''
 
@@ -273,11 +971,37 @@ class StatefulModel(CommonModel):
 
     ACTIONS_PERMISSION = {}
 
+    # send status changes to the live subscribers of core.live after commit, each costs an
+    # async_to_sync() round trip of group_send()s to the channel layer even without subscribers
+    PUBLISH_TRANSITIONS = False
+
+    # 'smallint' stores the status by the codes declared on STATUS, see AlterEnumStorage, in the
+    # model and the status columns of its log, archive and stat tables
+    STATUS_STORAGE = 'varchar'
+
+    # the same for the action columns of the log, archive, last doer and stat tables, by ACTION codes
+    ACTION_STORAGE = 'varchar'
+
+    # transition saved rows with UPDATE ... WHERE pk AND status (and VERSION_FIELD) are unchanged,
+    # retrying CAS_RETRIES times from a fresh status before raising ConcurrentTransition. Only the
+    # transition columns and the hooks' ``update_fields`` are written, pre_save()/post_save() still
+    # run. bulk_transition increments VERSION_FIELD too
+    COMPARE_AND_SWAP = False
+    CAS_RETRIES = 0
+    VERSION_FIELD = None
+
+    objects = StatefulModelQuerySet.as_manager()
+
     status = _StatusField()
     updated = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         abstract = True
+        # status filters and keyset pagination of StatefulModelViewSet, subclasses declaring Meta
+        # inherit it with ``class Meta(StatefulModel.Meta)``
+        indexes = [
+            models.Index(fields=['status', 'updated']),
+        ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -299,54 +1023,299 @@ class StatefulModel(CommonModel):
         class StateActionLog(models.Model):
             timestamp = models.DateTimeField(auto_now=True)
             stater = models.ForeignKey(cls, on_delete=models.CASCADE, related_name='actions')
-            status = EnumField(cls.STATUS, null=True)
+            status = EnumField(cls.STATUS, null=True, storage=cls.STATUS_STORAGE)
             user = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='+')
-            action = EnumField(cls.ACTION)
+            action = EnumField(cls.ACTION, storage=cls.ACTION_STORAGE)
 
             class Meta:
                 abstract = True
+                indexes = [
+                    models.Index(fields=['stater', 'action', 'timestamp']),
+                    models.Index(fields=['status', 'timestamp']),
+                ]
 
         return StateActionLog
 
+    @classproperty
+    def archived_action_log_class(cls):
+        """Optional archive of old action logs, filled by the archive_action_logs command.
+
+        Subclass it next to the action log, adding the same extra fields, to enable archiving into
+        a table and reading archived history through get_action_history().
+        """
+        class ArchivedStateActionLog(models.Model):
+            id = models.IntegerField(primary_key=True)
+            timestamp = models.DateTimeField()
+            stater = models.ForeignKey(cls, on_delete=models.CASCADE, related_name='archived_actions')
+            status = EnumField(cls.STATUS, null=True, storage=cls.STATUS_STORAGE)
+            user = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='+')
+            action = EnumField(cls.ACTION, storage=cls.ACTION_STORAGE)
+
+            class Meta:
+                abstract = True
+                indexes = [
+                    models.Index(fields=['stater', 'timestamp']),
+                ]
+
+        return ArchivedStateActionLog
+
+    @classproperty
+    def last_doer_class(cls):
+        """Optional index of the last user of each action, subclass it to let LAST_DOER skip the log."""
+        class StateLastDoer(models.Model):
+            timestamp = models.DateTimeField()
+            stater = models.ForeignKey(cls, on_delete=models.CASCADE, related_name='last_doers')
+            user = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='+')
+            action = EnumField(cls.ACTION, storage=cls.ACTION_STORAGE)
+
+            class Meta:
+                abstract = True
+                unique_together = [('stater', 'action')]
+
+        return StateLastDoer
+
+    @classproperty
+    def state_stat_class(cls):
+        """Optional daily summary of the action logs, subclass it and refresh it with refresh_state_stats.
+
+        Rows with ``status`` hold the stays in the status that ended that day, rows with ``action``
+        the number of times the action was done that day.
+        """
+        class StateStat(models.Model):
+            stater_model = cls
+
+            date = models.DateField()
+            status = EnumField(cls.STATUS, null=True, storage=cls.STATUS_STORAGE)
+            action = EnumField(cls.ACTION, null=True, storage=cls.ACTION_STORAGE)
+            count = models.PositiveIntegerField(default=0)
+            seconds = models.FloatField(default=0)
+            last_log_id = models.PositiveIntegerField(default=0)
+
+            class Meta:
+                abstract = True
+                unique_together = [('date', 'status', 'action')]
+
+        return StateStat
+
     @classmethod
-    def _get_transition_map(cls):
-        if not hasattr(cls, '_TRANSITION'):
-            cls._TRANSITION_MAP = {
-                (current_status, action): next_status
-                for current_status, action, next_status in
-                cls.TRANSITION
-            }
+    def check(cls, **kwargs):
+        errors = super().check(**kwargs)
+        errors.extend(cls.state_machine.check(cls))
+        return errors
+
+    @classmethod
+    def _get_log_class(cls):
+        return cls._meta.get_field('actions').related_model
 
-        return cls._TRANSITION_MAP
+    @classmethod
+    def _get_archived_log_class(cls):
+        try:
+            return cls._meta.get_field('archived_actions').related_model
+        except FieldDoesNotExist:
+            return None
 
     @classmethod
-    def _get_allowed_action_map(cls):
-        if not hasattr(cls, '_ALLOWED_ACTIONS'):
-            cls._ALLOWED_ACTIONS_MAP = {}
-            for current_status, action, next_status in cls.TRANSITION:
-                cls._ALLOWED_ACTIONS_MAP.setdefault(current_status, []).append(action)
+    def _get_last_doer_class(cls):
+        try:
+            return cls._meta.get_field('last_doers').related_model
+        except FieldDoesNotExist:
+            return None
 
-        return cls._ALLOWED_ACTIONS_MAP
+    @classmethod
+    def _get_state_stat_class(cls):
+        return next((model for model in apps.get_models() if getattr(model, 'stater_model', None) is cls), None)
 
-    def _create_log(self, status, user, action, options):
-        log = self.actions.model(
-            stater=self,
+    @classmethod
+    def _get_last_logs(cls, **filters):
+        """Latest log of each (stater, action) among the logs matching ``filters``."""
+        log_class = cls._get_log_class()
+        last_ids = log_class.objects.filter(**filters).values('stater_id', 'action').annotate(
+            last_id=models.Max('id'),
+        ).values('last_id')
+        return log_class.objects.filter(id__in=last_ids)
+
+    @classmethod
+    def _record_last_doers(cls, pks, user, action, timestamp):
+        last_doer_class = cls._get_last_doer_class()
+        if last_doer_class is None:
+            return
+
+        records = last_doer_class.objects.filter(stater_id__in=pks, action=action)
+        if records.update(user=user, timestamp=timestamp) < len(pks):
+            existing = set(records.values_list('stater_id', flat=True))
+            last_doer_class.objects.bulk_create(
+                last_doer_class(stater_id=pk, action=action, user=user, timestamp=timestamp)
+                for pk in pks
+                if pk not in existing
+            )
+
+    @classmethod
+    def _build_log(cls, status, user, action, options, **stater):
+        log_class = cls._get_log_class()
+        log = log_class(
             status=status,
             user=user,
             action=action,
+            **stater
         )
 
-        fields = {field.name for field in self.actions.model._meta.local_concrete_fields}
+        fields = {field.name for field in log_class._meta.local_concrete_fields}
         fields = fields.difference({'id', 'timestamp', 'stater', 'status', 'user', 'action'})
         for key, value in options.items():
             if key in fields:
                 setattr(log, key, value)
 
+        return log
+
+    def _create_log(self, status, user, action, options):
+        log = self._build_log(status, user, action, options, stater=self)
         log.save()
         return log
 
+    def get_action_history(self, include_archived=False):
+        """Action logs of this instance in chronological order, optionally with archived ones."""
+        logs = list(self.actions.order_by('timestamp', 'id'))
+        if include_archived and self._get_archived_log_class() is not None:
+            archived_logs = list(self.archived_actions.order_by('timestamp', 'id'))
+            logs = sorted(archived_logs + logs, key=lambda log: (log.timestamp, log.id))
+
+        return logs
+
+    @classmethod
+    def refresh_state_stats(cls, settle=60):
+        """Add the logs written since the last refresh to the state stat table, returning their number.
+
+        Logs younger than ``settle`` seconds wait for the next refresh, so that ids of transactions
+        still in flight are not skipped over. Refreshes of a model must not run concurrently.
+        """
+        stat_class = cls._get_state_stat_class()
+        if stat_class is None:
+            raise Exception('{} has no state stat class.'.format(cls._meta.label))
+
+        log_class = cls._get_log_class()
+        with transaction.atomic():
+            mark = stat_class.objects.aggregate(mark=models.Max('last_log_id'))['mark'] or 0
+            upper = log_class.objects.filter(
+                timestamp__lte=timezone.now() - timedelta(seconds=settle),
+            ).aggregate(upper=models.Max('id'))['upper']
+            if upper is None or upper <= mark:
+                return 0
+
+            stats = {}
+            for date, status, stays, seconds in cls._get_stays(log_class, mark, upper):
+                stats[date, status, None] = (stays, seconds)
+
+            actions = log_class.objects.filter(id__gt=mark, id__lte=upper).annotate(
+                date=TruncDate('timestamp'),
+            ).values_list('date', 'action').annotate(count=models.Count('id')).order_by()
+            for date, action, done in actions:
+                stats[date, None, action] = (done, 0)
+
+            existing = {
+                (stat.date, stat.status, stat.action): stat
+                for stat in stat_class.objects.filter(date__in={key[0] for key in stats})
+            }
+            changed = []
+            for key, (added, seconds) in stats.items():
+                stat = existing.get(key) or stat_class(date=key[0], status=key[1], action=key[2])
+                stat.count += added
+                stat.seconds += seconds
+                stat.last_log_id = upper
+                changed.append(stat)
+
+            stat_class.objects.bulk_update([stat for stat in changed if stat.pk], ['count', 'seconds', 'last_log_id'])
+            stat_class.objects.bulk_create([stat for stat in changed if not stat.pk])
+            return log_class.objects.filter(id__gt=mark, id__lte=upper).count()
+
+    @classmethod
+    def _get_stays(cls, log_class, mark, upper):
+        """(date, status, count, seconds) of the stays ended by the logs between the ids.
+
+        The log following each log, LEAD over the logs of its stater, holds the status entered by the
+        log and the time it was left.
+        """
+        connection = transaction.get_connection()
+        quote = connection.ops.quote_name
+        seconds = {
+            'postgresql': 'EXTRACT(EPOCH FROM (left_at - entered_at))',
+            'sqlite': '(julianday(left_at) - julianday(entered_at)) * 86400.0',
+            'mysql': 'TIMESTAMPDIFF(MICROSECOND, entered_at, left_at) / 1000000.0',
+        }.get(connection.vendor)
+        if seconds is None:
+            raise Exception('state stats are not supported on {}.'.format(connection.vendor))
+
+        tzname = timezone.get_current_timezone_name() if settings.USE_TZ else None
+        sql = """
+            SELECT {date}, status, COUNT(*), SUM({seconds})
+            FROM (
+                SELECT
+                    LEAD({id}) OVER w AS next_id,
+                    LEAD({status}) OVER w AS status,
+                    {timestamp} AS entered_at,
+                    LEAD({timestamp}) OVER w AS left_at
+                FROM {table}
+                WHERE {id} <= %s AND {stater} IN (
+                    SELECT {stater} FROM {table} WHERE {id} > %s AND {id} <= %s
+                )
+                WINDOW w AS (PARTITION BY {stater} ORDER BY {timestamp}, {id})
+            ) stays
+            WHERE next_id > %s
+            GROUP BY 1, 2
+        """.format(
+            date=connection.ops.datetime_cast_date_sql('left_at', tzname),
+            seconds=seconds,
+            table=quote(log_class._meta.db_table),
+            id=quote(log_class._meta.pk.column),
+            status=quote(log_class._meta.get_field('status').column),
+            timestamp=quote(log_class._meta.get_field('timestamp').column),
+            stater=quote(log_class._meta.get_field('stater').column),
+        )
+        status_field = log_class._meta.get_field('status')
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [upper, mark, upper, mark])
+            for date, status, stays, total in cursor.fetchall():
+                if isinstance(date, str):
+                    date = models.DateField().to_python(date)
+                yield date, status_field.from_db_value(status, None, connection), stays, total
+
+    @classmethod
+    def _get_state_stats(cls, since=None, until=None):
+        stat_class = cls._get_state_stat_class()
+        if stat_class is None:
+            raise Exception('{} has no state stat class.'.format(cls._meta.label))
+
+        stats = stat_class.objects.all()
+        if since:
+            stats = stats.filter(date__gte=since)
+        if until:
+            stats = stats.filter(date__lte=until)
+        return stats
+
+    @classmethod
+    def get_time_in_status(cls, since=None, until=None):
+        """{status: {'count', 'seconds', 'average'}} of the stays ended between the dates."""
+        rows = cls._get_state_stats(since, until).filter(action=None).values('status').annotate(
+            total_count=models.Sum('count'),
+            total_seconds=models.Sum('seconds'),
+        ).order_by()
+        return {
+            row['status']: {
+                'count': row['total_count'],
+                'seconds': row['total_seconds'],
+                'average': row['total_seconds'] / row['total_count'] if row['total_count'] else None,
+            }
+            for row in rows
+        }
+
+    @classmethod
+    def get_action_throughput(cls, since=None, until=None):
+        """[(date, action, count)] of the actions done between the dates."""
+        return list(cls._get_state_stats(since, until).filter(status=None).order_by(
+            'date', 'action',
+        ).values_list('date', 'action', 'count'))
+
     def get_allowed_actions(self):
-        return self._get_allowed_action_map().get(self.status, [])
+        return list(self.state_machine.get_allowed_actions(self.status))
 
     def get_permitted_allowed_actions(self, user):
         model = self.__class__
@@ -359,8 +1328,50 @@ class StatefulModel(CommonModel):
             if self.check_permitted_action(action, user)
         ]
 
+    @classmethod
+    def get_permitted_allowed_actions_many(cls, instances, user):
+        """Batch form of get_permitted_allowed_actions() for a page of instances.
+
+        Permissions are evaluated with permit_many() per action and every LAST_DOER lookup of the
+        page is resolved in one grouped query, so the query count does not grow with the page size.
+        """
+        instances = list(instances)
+        allowed_actions = [instance.get_allowed_actions() for instance in instances]
+        if not cls.ACTIONS_PERMISSION:
+            return allowed_actions
+
+        last_doer_actions = {
+            permission.action
+            for permissions in cls.ACTIONS_PERMISSION.values()
+            for root in permissions
+            for permission in root.iter_permissions()
+            if isinstance(permission, ACTION_PERMISSION.LAST_DOER)
+        }
+        if last_doer_actions:
+            ACTION_PERMISSION.LAST_DOER.prefetch(instances, last_doer_actions)
+
+        candidates = {}
+        for i, actions in enumerate(allowed_actions):
+            for action in actions:
+                candidates.setdefault(action, []).append(i)
+
+        permitted = set()
+        for action, indexes in candidates.items():
+            for permission in cls.ACTIONS_PERMISSION.get(action, []):
+                if not indexes:
+                    break
+
+                results = permission.permit_many([instances[i] for i in indexes], user)
+                permitted.update((i, action) for i, result in zip(indexes, results) if result)
+                indexes = [i for i, result in zip(indexes, results) if not result]
+
+        return [
+            [action for action in actions if (i, action) in permitted]
+            for i, actions in enumerate(allowed_actions)
+        ]
+
     def check_allowed_action(self, action):
-        return (self.status, action) in self._get_transition_map()
+        return self.state_machine.get_next_status(self.status, action) is not None
 
     def check_permitted_action(self, action, user):
         model = self.__class__
@@ -371,29 +1382,174 @@ class StatefulModel(CommonModel):
 
         return False
 
-    def transition(self, user, action, **options):
-        transition_map = self._get_transition_map()
-        if not (self.status, action) in transition_map:
+    def _prepare_transition(self, user, action, options):
+        if self.state_machine.get_next_status(self.status, action) is None:
             raise Exception('invalid action')
 
         self.user = user
         options['user'] = user
         options['old_status'] = self.status
 
-        pre_function = getattr(self, 'pre_{}'.format(action.name.lower()), None)
-        if callable(pre_function):
-            pre_function(options)
+    def _compare_and_swap(self, old_status, new_status, options):
+        """Write only the transition columns, plus the hooks' ``update_fields``, if the row is unchanged.
+
+        pre_save() and post_save() run around the UPDATE as in internal_save(), fields pre_save()
+        changes are written only when listed in ``update_fields``.
+        """
+        self.pre_save()
+        filters = {'pk': self.pk, 'status': old_status}
+        values = {'status': new_status, 'updated': timezone.now()}
+        if self.VERSION_FIELD:
+            version = getattr(self, self.VERSION_FIELD)
+            filters[self.VERSION_FIELD] = version
+            values[self.VERSION_FIELD] = version + 1
+        for name in options.get('update_fields', []):
+            values[name] = getattr(self, name)
+
+        if not self.__class__._default_manager.filter(**filters).update(**values):
+            raise ConcurrentTransition('{} {} is no longer {}.'.format(self._meta.label, self.pk, old_status))
+
+        for name, value in values.items():
+            setattr(self, name, value)
+        self.post_save()
 
+    def _reload_for_transition(self):
+        self.refresh_from_db(fields=['status', 'updated'] + ([self.VERSION_FIELD] if self.VERSION_FIELD else []))
+
+    def _apply_transition(self, user, action, options):
         with transaction.atomic():
             old_status = self.status
-            self.status = transition_map[(old_status, action)]
-            self.updated = timezone.now()
-            self.internal_save()
+            new_status = self.state_machine.get_next_status(old_status, action)
+            if self.COMPARE_AND_SWAP and not self._state.adding:
+                self._compare_and_swap(old_status, new_status, options)
+            else:
+                self.status = new_status
+                self.updated = timezone.now()
+                self.internal_save()
             options['log'] = self._create_log(old_status, user, action, options)
             options['new_status'] = self.status
+            self._record_last_doers([self.pk], user, action, options['log'].timestamp)
+            if self.PUBLISH_TRANSITIONS:
+                transaction.on_commit(partial(live.publish_transition, self, old_status, self.status, action, user))
+
+        if getattr(self, '_last_doers', None) is not None:
+            self._last_doers[action] = user.pk
 
-        post_function = getattr(self, 'post_{}'.format(action.name.lower()), None)
-        if callable(post_function):
-            post_function(options)
+    def transition(self, user, action, **options):
+        for attempt in count():
+            self._prepare_transition(user, action, options)
+            self.state_machine.call_hook('pre', action, self, options)
+            try:
+                self._apply_transition(user, action, options)
+                break
+            except ConcurrentTransition:
+                if attempt >= self.CAS_RETRIES:
+                    raise
+                self._reload_for_transition()
+
+        self.state_machine.call_hook('post', action, self, options)
+        return options['log']
+
+    async def atransition(self, user, action, **options):
+        """Awaitable transition() doing all of its database work in a single thread hop.
+
+        Coroutine ``pre_<action>``/``post_<action>`` hooks are awaited in the event loop, plain
+        hooks run in the same hop as the database work.
+        """
+        state_machine = self.state_machine
+        pre_function = state_machine.get_hook('pre', action)
+        async_pre_function = None
+        if pre_function and state_machine.is_coroutine_hook(pre_function):
+            async_pre_function, pre_function = pre_function, None
+
+        post_function = state_machine.get_hook('post', action)
+        async_post_function = None
+        if post_function and state_machine.is_coroutine_hook(post_function):
+            async_post_function, post_function = post_function, None
+
+        def apply():
+            if pre_function:
+                pre_function(self, options)
+            self._apply_transition(user, action, options)
+            if post_function:
+                post_function(self, options)
+
+        for attempt in count():
+            self._prepare_transition(user, action, options)
+            if async_pre_function:
+                await async_pre_function(self, options)
+            try:
+                await database_sync_to_async(apply)()
+                break
+            except ConcurrentTransition:
+                if attempt >= self.CAS_RETRIES:
+                    raise
+                await database_sync_to_async(self._reload_for_transition)()
+
+        if async_post_function:
+            await async_post_function(self, options)
 
         return options['log']
+
+    @classmethod
+    def bulk_transition(cls, queryset, user, action, **options):
+        """Apply ``action`` to every row of ``queryset`` with set-based queries.
+
+        Rows are locked and grouped by their current status; the transition is checked once per
+        group, each group is moved with a single UPDATE and the logs are written with one bulk_create.
+        Either every row can take the action or nothing is changed.
+
+        Per-instance ``pre_<action>``/``post_<action>`` hooks cannot run here. Define the batch form
+        ``pre_bulk_<action>(options)``/``post_bulk_<action>(options)`` as classmethods instead,
+        otherwise bulk transition is refused. Besides the given options, hooks receive ``user``,
+        ``action`` and ``groups`` (old status -> list of pk); post hooks also receive ``logs``.
+        ``CommonModel.pre_save``/``post_save`` are not called, as with ``QuerySet.update()``.
+        Live subscribers get one status change per status group on the model topic only.
+        """
+        state_machine = cls.state_machine
+        for prefix in ('pre', 'post'):
+            if state_machine.get_hook(prefix, action) and not state_machine.get_hook(prefix + '_bulk', action):
+                raise Exception('bulk transition is not allowed, {}_{} has no batch form.'.format(
+                    prefix, action.name.lower()
+                ))
+
+        options['user'] = user
+        options['action'] = action
+
+        with transaction.atomic():
+            groups = {}
+            rows = cls._default_manager.filter(
+                pk__in=queryset.values('pk'),
+            ).select_for_update().order_by('pk').values_list('pk', 'status')
+            for pk, status in rows:
+                groups.setdefault(status, []).append(pk)
+
+            for status in groups:
+                if state_machine.get_next_status(status, action) is None:
+                    raise Exception('invalid action')
+
+            options['groups'] = groups
+            state_machine.call_hook('pre_bulk', action, options)
+
+            now = timezone.now()
+            logs = []
+            for old_status, pks in groups.items():
+                values = {'status': state_machine.get_next_status(old_status, action), 'updated': now}
+                if cls.VERSION_FIELD:
+                    values[cls.VERSION_FIELD] = models.F(cls.VERSION_FIELD) + 1
+                cls._default_manager.filter(pk__in=pks, status=old_status).update(**values)
+                logs.extend(cls._build_log(old_status, user, action, options, stater_id=pk) for pk in pks)
+
+            options['logs'] = cls._get_log_class().objects.bulk_create(logs)
+            cls._record_last_doers([log.stater_id for log in logs], user, action, now)
+            if cls.PUBLISH_TRANSITIONS:
+                transaction.on_commit(partial(live.publish_bulk_transition, cls, groups, action, user))
+
+        state_machine.call_hook('post_bulk', action, options)
+
+        return options['logs']
+
+    @classmethod
+    async def abulk_transition(cls, queryset, user, action, **options):
+        """Awaitable bulk_transition(), run in one database thread hop."""
+        return await database_sync_to_async(cls.bulk_transition)(queryset, user, action, **options)
@@ -1,7 +1,17 @@
+from collections import OrderedDict
+from functools import lru_cache
+
+from channels.db import database_sync_to_async
+from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import QuerySet
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.relations import PKOnlyObject
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
 
-from core.models import StatefulModel
+from core.models import StatefulModel, _MultiEnumMixin, async_atomic
 
 
 class ActionField(serializers.Field):
@@ -37,7 +47,46 @@ class AutoUserField(serializers.Field):
         return data
 
     def get_attribute(self, instance):
-        return super().get_attribute(instance)
+        """The related user as joined by with_audit_users(), else from a per-request cache.
+
+        Missing users are loaded for the whole page of a list at once.
+        """
+        try:
+            field = instance._meta.get_field(self.source) if len(self.source_attrs) == 1 else None
+        except FieldDoesNotExist:
+            field = None
+        if field is None or not (field.many_to_one and field.concrete):
+            return super().get_attribute(instance)
+
+        if field.is_cached(instance):
+            return field.get_cached_value(instance)
+
+        user_id = getattr(instance, field.attname)
+        if user_id is None:
+            return None
+
+        users = self._get_user_cache()
+        if user_id not in users:
+            user_ids = {user_id} | self._get_page_user_ids(field.attname)
+            users.update(User.objects.only('id', 'username').in_bulk(user_ids.difference(users)))
+
+        return users.get(user_id)
+
+    def _get_user_cache(self):
+        request = self.context.get('request')
+        owner = request if request is not None else self.root
+        if not hasattr(owner, '_audit_users'):
+            owner._audit_users = {}
+        return owner._audit_users
+
+    def _get_page_user_ids(self, attname):
+        instances = getattr(self.parent.parent, 'instance', None) if self.parent else None
+        if isinstance(instances, QuerySet):
+            instances = instances._result_cache
+        if not isinstance(instances, (list, tuple)):
+            return set()
+
+        return {getattr(instance, attname) for instance in instances} - {None}
 
     def to_representation(self, value):
         return value.username
@@ -48,7 +97,13 @@ class AllowedActionsField(serializers.Field):
         super().__init__(source='*', read_only=True)
 
     def to_representation(self, instance: StatefulModel):
-        return [action.name for action in instance.get_permitted_allowed_actions(self.context['request'].user)]
+        permitted_allowed_actions = getattr(self.parent.parent, 'permitted_allowed_actions', None)
+        if permitted_allowed_actions and instance.pk in permitted_allowed_actions:
+            actions = permitted_allowed_actions[instance.pk]
+        else:
+            actions = instance.get_permitted_allowed_actions(self.context['request'].user)
+
+        return [action.name for action in actions]
 
 
 class EnumField(serializers.Field):
@@ -66,13 +121,64 @@ class EnumField(serializers.Field):
         return enum
 
 
-class CommonModelSerializer(serializers.ModelSerializer):
+class MultiEnumField(serializers.Field):
+    def __init__(self, enum, **kwargs):
+        self.enum = enum
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return [member.name for member in value or []]
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = data.split(',') if data else []
+        if not isinstance(data, list):
+            raise ValidationError('Expected a list of names.')
+
+        members = [self.enum.get(name) if isinstance(name, str) else None for name in data]
+        if None in members:
+            raise ValidationError('"{}" has an invalid enum.'.format(data))
+        return members
+
+
+class _EnumModelSerializerMixin:
+    """Map MultiEnumField, MultiEnumArrayField and MultiEnumBitmaskField to lists of member names."""
+
+    def build_standard_field(self, field_name, model_field):
+        if not isinstance(model_field, _MultiEnumMixin):
+            return super().build_standard_field(field_name, model_field)
+
+        kwargs = {'enum': model_field.enum}
+        if model_field.blank or model_field.has_default() or model_field.null:
+            kwargs['required'] = False
+        if model_field.null:
+            kwargs['allow_null'] = True
+        if not model_field.editable:
+            kwargs = {'enum': model_field.enum, 'read_only': True}
+        return MultiEnumField, kwargs
+
+
+class CommonModelSerializer(_EnumModelSerializerMixin, serializers.ModelSerializer):
     @property
     def user(self):
         return self.context['request'].user
 
 
-class StatefulSerializer(serializers.ModelSerializer):
+class StatefulListSerializer(serializers.ListSerializer):
+    """Resolve allowed actions of the whole page with batched permission checks."""
+
+    def to_representation(self, data):
+        instances = list(data.all() if isinstance(data, models.Manager) else data)
+        model = self.child.Meta.model
+        permitted = model.get_permitted_allowed_actions_many(instances, self.context['request'].user)
+        self.permitted_allowed_actions = {
+            instance.pk: actions
+            for instance, actions in zip(instances, permitted)
+        }
+        return super().to_representation(instances)
+
+
+class StatefulSerializer(_EnumModelSerializerMixin, serializers.ModelSerializer):
     action = ActionField()
     status = serializers.CharField(source='status.name', read_only=True)
     allowed_actions = AllowedActionsField()
@@ -81,6 +187,16 @@ class StatefulSerializer(serializers.ModelSerializer):
         self.context['action'] = action
         return action
 
+    async def ais_valid(self, raise_exception=False):
+        return await database_sync_to_async(self.is_valid)(raise_exception=raise_exception)
+
+    async def asave(self, **kwargs):
+        """Awaitable save() for async views and consumers, run atomically in one thread hop."""
+        return await async_atomic(self.save)(**kwargs)
+
+    async def adata(self):
+        return await database_sync_to_async(lambda: self.data)()
+
     @staticmethod
     def required_action(validate_method):
         def inner_validate_method(self, value):
@@ -94,9 +210,18 @@ class StatefulSerializer(serializers.ModelSerializer):
     class Meta:
         abstract = True
         fields = ['action', 'status', 'allowed_actions']
+        list_serializer_class = StatefulListSerializer
+
 
+@lru_cache(maxsize=None)
+def get_all_field_serializer(model, compiled=False):
+    """All field serializer of the model, built once per model.
+
+    ``compiled=True`` gives its read-only CompiledReadSerializer instead.
+    """
+    if compiled:
+        return CompiledReadSerializer.compile(get_all_field_serializer(model))
 
-def get_all_field_serializer(model):
     _model = model
 
     class AllFieldCommonModelSerializer(CommonModelSerializer):
@@ -105,3 +230,101 @@ def get_all_field_serializer(model):
             fields = '__all__'
 
     return AllFieldCommonModelSerializer
+
+
+class CompiledReadSerializer:
+    """Read-only stand-in of a ModelSerializer class rendering querysets from ``.values_list()`` rows.
+
+    Converters of the serializer fields are resolved once per class (a dict per enum), the output
+    equals the ``data`` of the serializer. Fields must map to concrete model fields.
+    """
+
+    serializer_class = None
+    columns = ()
+
+    def __init__(self, instance=None, many=False, context=None):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @classmethod
+    def compile(cls, serializer_class):
+        model = serializer_class.Meta.model
+        columns = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                raise Exception('{}.{} cannot be compiled.'.format(serializer_class.__name__, name))
+
+            if not model_field.concrete or model_field.many_to_many:
+                raise Exception('{}.{} cannot be compiled.'.format(serializer_class.__name__, name))
+
+            columns.append((name, model_field.attname, cls._get_converter(field, model_field)))
+
+        return type('Compiled' + serializer_class.__name__, (cls,), {
+            'serializer_class': serializer_class,
+            'columns': tuple(columns),
+        })
+
+    @staticmethod
+    def _get_converter(field, model_field):
+        if isinstance(field, AutoUserField):
+            return AutoUserField
+
+        if isinstance(field, serializers.RelatedField):
+            if not field.use_pk_only_optimization():
+                raise Exception('{} cannot be compiled.'.format(field.__class__.__name__))
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+                return None
+            return lambda pk: field.to_representation(PKOnlyObject(pk))
+
+        enum = getattr(model_field, 'enum', None)
+        if enum is not None and not isinstance(model_field, _MultiEnumMixin):
+            representations = {member: field.to_representation(member) for member in enum}
+            return lambda value: representations[value] if value in representations else field.to_representation(value)
+
+        if type(field) is serializers.IntegerField:
+            return int
+
+        if type(field) is serializers.CharField:
+            return str
+
+        return field.to_representation
+
+    def _get_rows(self, instances):
+        attnames = [attname for name, attname, converter in self.columns]
+        if isinstance(instances, models.Manager):
+            instances = instances.all()
+        if isinstance(instances, QuerySet) and instances._result_cache is None:
+            return instances.values_list(*attnames)
+
+        return (tuple(getattr(instance, attname) for attname in attnames) for instance in instances)
+
+    def _render(self, rows):
+        names = [name for name, attname, converter in self.columns]
+        converters = [converter for name, attname, converter in self.columns]
+        if AutoUserField in converters:
+            # usernames of the AutoUserField columns, one query for the whole list
+            rows = list(rows)
+            user_ids = {row[i] for row in rows for i, converter in enumerate(converters) if converter is AutoUserField}
+            usernames = dict(User.objects.filter(id__in=user_ids - {None}).values_list('id', 'username'))
+            converters = [usernames.get if converter is AutoUserField else converter for converter in converters]
+
+        return [
+            OrderedDict(
+                (name, value if value is None or converter is None else converter(value))
+                for name, converter, value in zip(names, converters, row)
+            )
+            for row in rows
+        ]
+
+    @property
+    def data(self):
+        if self.many:
+            return ReturnList(self._render(self._get_rows(self.instance)), serializer=self)
+
+        return ReturnDict(self._render(self._get_rows([self.instance]))[0], serializer=self)
@@ -4,4 +4,10 @@ from . import views
 
 urlpatterns = [
     path('auth/', views.AuthenticationView.as_view()),
-]
\ No newline at end of file
+    path('stateful/<str:app_label>/<str:model_name>/',
+         views.StatefulModelViewSet.as_view({'get': 'list'})),
+    path('stateful/<str:app_label>/<str:model_name>/export/',
+         views.StatefulModelViewSet.as_view({'get': 'export'})),
+    path('stateful/<str:app_label>/<str:model_name>/<pk>/',
+         views.StatefulModelViewSet.as_view({'get': 'retrieve'})),
+]
@@ -1,10 +1,28 @@
+import base64
+import hashlib
+import json
+from functools import lru_cache
+
+from django.apps import apps
 from django.contrib.auth import authenticate, login, logout
-from django.http import HttpResponseNotFound
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from django.http import Http404, HttpResponseNotFound
 from django.shortcuts import render
-from rest_framework.exceptions import ValidationError
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from rest_framework import mixins, viewsets
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.pagination import BasePagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
+from core.export import FORMATS, export_response
+from core.models import StatefulModel
+from core.serializers import StatefulSerializer
+
 
 def not_found(request):
     return HttpResponseNotFound()
@@ -36,3 +54,191 @@ class AuthenticationView(APIView):
     def delete(self, request):
         logout(request)
         return self.get(request)
+
+
+class KeysetPagination(BasePagination):
+    """Newest first pages over (updated, pk), the cursor holding the last row of the previous page."""
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            page_size = max(1, min(int(request.query_params.get(self.page_size_query_param, self.page_size)),
+                                   self.max_page_size))
+        except ValueError:
+            page_size = self.page_size
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            updated, pk = self.decode_cursor(cursor, queryset.model._meta.pk)
+            queryset = queryset.filter(Q(updated__lt=updated) | Q(updated=updated, pk__lt=pk))
+
+        page = list(queryset.order_by('-updated', '-pk')[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def decode_cursor(self, cursor, pk_field):
+        try:
+            updated, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            updated = parse_datetime(updated)
+            pk = pk_field.to_python(pk)
+        except (TypeError, ValueError, UnicodeDecodeError, DjangoValidationError):
+            raise NotFound('Invalid cursor')
+
+        if updated is None or pk is None:
+            raise NotFound('Invalid cursor')
+        return updated, pk
+
+    def encode_cursor(self, instance):
+        return base64.urlsafe_b64encode(json.dumps([instance.updated.isoformat(), instance.pk]).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+@lru_cache(maxsize=None)
+def get_stateful_serializer(model):
+    _model = model
+
+    class AllFieldStatefulSerializer(StatefulSerializer):
+        class Meta(StatefulSerializer.Meta):
+            model = _model
+            fields = '__all__'
+
+    return AllFieldStatefulSerializer
+
+
+class StatefulModelViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """List and retrieve objects of a stateful model with keyset pagination and conditional GET.
+
+    Filter with ``?status=A,B`` and ``?action=X`` (objects whose status allows the action). Without
+    ``queryset``, the model comes from the ``app_label`` and ``model_name`` URL kwargs and requires
+    its view permission, with an all field StatefulSerializer unless ``serializer_class`` is set.
+
+    The ETag of a list covers the (pk, updated) of the returned page only, no query spans the
+    whole table, and only retrieve sends Last-Modified.
+
+    ``export`` streams the filtered objects, or their action logs with ``?logs=1``, as
+    ``?type=ndjson|csv`` (gzipped with ``?gzip=1``).
+    """
+
+    pagination_class = KeysetPagination
+
+    def get_model(self):
+        if self.queryset is not None:
+            return self.queryset.model
+
+        try:
+            model = apps.get_model(self.kwargs['app_label'], self.kwargs['model_name'])
+        except LookupError:
+            raise Http404
+
+        if not issubclass(model, StatefulModel):
+            raise Http404
+
+        if not self.request.user.has_perm('{}.view_{}'.format(model._meta.app_label, model._meta.model_name)):
+            raise PermissionDenied()
+        return model
+
+    def get_queryset(self):
+        if self.queryset is not None:
+            return super().get_queryset()
+        return self.get_model()._default_manager.all()
+
+    def get_serializer_class(self):
+        if self.serializer_class is not None:
+            return self.serializer_class
+        return get_stateful_serializer(self.get_model())
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        model = queryset.model
+        statuses = self.request.query_params.get('status')
+        if statuses:
+            queryset = queryset.filter(status__in=self._get_members(model.STATUS, statuses))
+
+        actions = self.request.query_params.get('action')
+        if actions:
+            actions = self._get_members(model.ACTION, actions)
+            queryset = queryset.filter(status__in=[
+                status for status in model.STATUS
+                if set(actions).intersection(model.state_machine.get_allowed_actions(status))
+            ])
+
+        return queryset
+
+    @staticmethod
+    def _get_members(enum, names):
+        members = [enum.get(name) for name in names.split(',')]
+        if None in members:
+            raise ValidationError({enum.__name__.lower(): '"{}" has an invalid name.'.format(names)})
+        return members
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else list(queryset)
+        keys = [[instance.pk, instance.updated] for instance in rows]
+        has_next = getattr(self.paginator, 'has_next', None)
+        # no Last-Modified, rows leave a page without its newest updated changing
+        response = self._conditional(request, None, keys, has_next)
+        if response:
+            return response
+
+        serializer = self.get_serializer(rows, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self._conditional(request, instance.updated, instance.pk) or Response(
+            self.get_serializer(instance).data,
+        )
+
+    def export(self, request, *args, **kwargs):
+        export_format = request.query_params.get('type', 'ndjson')
+        if export_format not in FORMATS:
+            raise ValidationError({'type': '"{}" is not one of {}.'.format(export_format, ', '.join(FORMATS))})
+
+        queryset = self.filter_queryset(self.get_queryset())
+        model = queryset.model
+        filename = model._meta.label_lower
+        if request.query_params.get('logs') == '1':
+            queryset = model._get_log_class().objects.filter(stater__in=queryset)
+            filename += '.actions'
+
+        return export_response(queryset, filename, export_format, request.query_params.get('gzip') == '1')
+
+    def _conditional(self, request, updated, *keys):
+        """304 response if the client copy is current, else None after recording the validators for finalize_response."""
+        etag = '"{}"'.format(hashlib.md5(json.dumps([
+            updated.isoformat() if updated else None, request.user.pk, request.get_full_path(), *keys,
+        ], default=str).encode()).hexdigest())
+        last_modified = int(updated.timestamp()) if updated else None
+        self._validators = etag, last_modified
+        return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, '_validators', None)
+        if validators and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
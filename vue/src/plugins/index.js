@@ -1,2 +1,3 @@
 import './axios'
 import './chartist'
+import './socket'
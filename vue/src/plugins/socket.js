@@ -0,0 +1,49 @@
+import Vue from 'vue'
+
+import { decode } from '@msgpack/msgpack'
+import { inflate } from 'pako'
+
+// first byte of every binary frame, see core/live.py
+const FRAME_ZLIB = 1
+const FRAME_JSON = 2
+
+const textDecoder = new TextDecoder()
+
+export const decodeFrame = data => {
+  if (typeof data === 'string') return JSON.parse(data)
+
+  const flags = new Uint8Array(data, 0, 1)[0]
+  let body = new Uint8Array(data, 1)
+  if (flags & FRAME_ZLIB) body = inflate(body)
+  return flags & FRAME_JSON ? JSON.parse(textDecoder.decode(body)) : decode(body)
+}
+
+const bus = new Vue()
+let socket = null
+
+export const connect = ({ encoding = 'msgpack', compression = 'zlib' } = {}) => {
+  const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws'
+  const query = `encoding=${encoding}&compression=${compression}`
+  socket = new WebSocket(`${protocol}://${window.location.host}/ws/socket/?${query}`)
+  socket.binaryType = 'arraybuffer'
+  socket.onmessage = ({ data }) => {
+    const event = decodeFrame(data)
+    bus.$emit(event.type, event)
+  }
+  return socket
+}
+
+// status_change events of a stateful model ("app_label.model_name"), or of one object with pk
+export const subscribe = (model, pk = null) =>
+  socket.send(JSON.stringify({ type: 'subscribe', model, pk }))
+
+export const unsubscribe = (model, pk = null) =>
+  socket.send(JSON.stringify({ type: 'unsubscribe', model, pk }))
+
+Vue.prototype.$socket = {
+  connect,
+  subscribe,
+  unsubscribe,
+  on: (type, callback) => bus.$on(type, callback),
+  off: (type, callback) => bus.$off(type, callback),
+}